@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bank_profiles import BankProfiles as profiles
+from drive_statements import DriveStatements as statements
+from google_manager import GoogleManager as gdrive
+from ocr_cache import OcrCache as cache
+from ocr_processor import OcrProcessor as ocr
+from pdf_extractor import PdfExtractor as pdf
+from screenshot_stitcher import ScreenshotStitcher as stitcher
+from utils import month_names
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+class Backfill:
+
+    lock = threading.Lock()
+
+    def __init__(self, output_dir, local_dir=None, restart=False):
+        self.output_dir = output_dir
+        self.local_dir = local_dir
+        # O checkpoint acompanha a saída: outro --output começa do zero. O "_" faz o
+        # pandas/pyarrow ignorar o arquivo ao ler o diretório do Parquet
+        os.makedirs(output_dir, exist_ok=True)
+        self.checkpoint_path = os.path.join(output_dir, '_backfill_checkpoint.json')
+        self.checkpoint = {} if restart else self.load_checkpoint()
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_checkpoint(self, key, entry):
+        # Gravado a cada unidade concluída: uma falha no meio não perde o que já foi feito
+        with self.lock:
+            self.checkpoint[key] = entry
+            tmp_path = f"{self.checkpoint_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump(self.checkpoint, fh, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.checkpoint_path)
+
+    def get_unit_key(unit):
+        return f"{unit['bank']}/{unit['year']}/{unit['month'] or '-'}"
+
+    def get_unit_source(unit):
+        # Origem da unidade: trocar entre o Drive e --local-dir reprocessa tudo
+        return f"local:{os.path.abspath(unit['path'])}" if 'path' in unit else f"drive:{unit['folder_id']}"
+
+    def is_done(self, unit):
+        entry = self.checkpoint.get(Backfill.get_unit_key(unit), {})
+        return entry.get('status') == 'ok' and entry.get('source') == Backfill.get_unit_source(unit)
+
+    def discover_drive_units(self, banks, years=None):
+        # Financeiro/<banco>/<ano> e, quando existirem, as subpastas de mês
+        units = []
+        for bank in banks:
+            bank_folder_id = gdrive.find_folder_id(gdrive.credentials_path, 'Financeiro', None, bank)
+            if bank_folder_id is None:
+                continue
+            for year_folder in gdrive.list_subfolders_from_drive(bank_folder_id, gdrive.credentials_path):
+                if years and year_folder['name'] not in years:
+                    continue
+                units.append({'bank': bank, 'year': year_folder['name'], 'month': None, 'folder_id': year_folder['id']})
+                for month_folder in gdrive.list_subfolders_from_drive(year_folder['id'], gdrive.credentials_path):
+                    if month_folder['name'] in month_names:
+                        units.append({'bank': bank, 'year': year_folder['name'], 'month': month_folder['name'], 'folder_id': month_folder['id']})
+        return units
+
+    def discover_local_units(self, banks, years=None):
+        # Espelho local com a mesma estrutura: <dir>/<banco>/<ano>[/<mês>]/*.png
+        units = []
+        for bank in banks:
+            bank_dir = os.path.join(self.local_dir, bank)
+            if not os.path.isdir(bank_dir):
+                continue
+            for year in sorted(os.listdir(bank_dir)):
+                year_dir = os.path.join(bank_dir, year)
+                if not os.path.isdir(year_dir) or (years and year not in years):
+                    continue
+                units.append({'bank': bank, 'year': year, 'month': None, 'path': year_dir})
+                for month in sorted(os.listdir(year_dir)):
+                    if month in month_names and os.path.isdir(os.path.join(year_dir, month)):
+                        units.append({'bank': bank, 'year': year, 'month': month, 'path': os.path.join(year_dir, month)})
+        return units
+
+    def extract_unit_texts(self, unit):
+        if 'path' in unit:
+            names = sorted(os.listdir(unit['path']))
+            paths = [os.path.join(unit['path'], name) for name in names if name.lower().endswith(IMAGE_EXTENSIONS)]
+            pdf_paths = [os.path.join(unit['path'], name) for name in names if name.lower().endswith('.pdf')]
+            if not stitcher.enabled:
+                texts = ocr.extract_texts_from_images(paths, bank_name=unit['bank'])
+            else:
+                regions = stitcher.iter_regions(paths, unit['bank'])
+                entries = ((region, stitcher.get_region_id(region), None) for region in regions)
+                detections = ocr.iter_detections_from_images(entries, bank_name=unit['bank'], crop_bands=False)
+                texts = [ocr.get_text(image_detections) for image_detections in detections]
+            # Faturas em PDF entram na mesma ordem (nome do arquivo) que os prints
+            texts = dict(zip(paths, texts))
+            for path in pdf_paths:
+                texts[path] = pdf.extract(path, cache.file_md5(path), bank_name=unit['bank'])[0]
+            paths = sorted(texts)
+            return paths, [texts[path] for path in paths]
+
+        files = sorted(gdrive.list_statement_files_from_drive(unit['folder_id'], gdrive.credentials_path), key=lambda item: item['name'])
+        return [item['id'] for item in files], statements.extract_texts(unit['bank'], files)
+
+    def write_partitions(self, unit, df):
+        # Partição por mês da fatura (subpasta) ou, sem ela, pelo mês de cada lançamento
+        if unit['month']:
+            df['month'] = f"{month_names.index(unit['month']) + 1:02d}"
+        else:
+            df['month'] = df['data_lancamento'].dt.strftime('%m').fillna('00')
+        df['bank'] = unit['bank']
+        df['year'] = str(unit['year'])
+
+        suffix = unit['month'] or 'ano'
+        paths = []
+        for month, part in df.groupby('month'):
+            partition_dir = os.path.join(self.output_dir, f"bank={unit['bank']}", f"year={unit['year']}", f"month={month}")
+            os.makedirs(partition_dir, exist_ok=True)
+            path = os.path.join(partition_dir, f"part-{suffix}.parquet")
+            tmp_path = f"{path}.tmp"
+            part.drop(columns=['bank', 'year', 'month']).to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            paths.append(path)
+        return paths
+
+    def process_unit(self, unit):
+        started = time.perf_counter()
+        sources, texts = self.extract_unit_texts(unit)
+        transactions = ocr.extract_transactions_from_screenshots(texts, unit['bank'])
+        df = ocr.parse_credit_card_statement(transactions, unit['bank'], unit['year'])
+        paths = self.write_partitions(unit, df) if len(df) else []
+        return {
+            'status': 'ok',
+            'images': len(sources),
+            'transactions': len(df),
+            'files': paths,
+            'seconds': round(time.perf_counter() - started, 2)
+        }
+
+    def run(self, units, jobs=4):
+        pending = [unit for unit in units if not self.is_done(unit)]
+        print(f"{len(units) - len(pending)} unidades já concluídas, {len(pending)} a processar")
+
+        failures = 0
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(self.process_unit, unit): unit for unit in pending}
+            for future in as_completed(futures):
+                unit = futures[future]
+                key = Backfill.get_unit_key(unit)
+                try:
+                    entry = future.result()
+                    print(f"✅ {key}: {entry['transactions']} transações de {entry['images']} imagens em {entry['seconds']}s")
+                except Exception as error:
+                    failures += 1
+                    entry = {'status': 'erro', 'error': str(error), 'traceback': traceback.format_exc()}
+                    print(f"❌ {key}: {error}")
+                self.save_checkpoint(key, dict(entry, source=Backfill.get_unit_source(unit)))
+        return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Reprocessa faturas antigas e grava as transações em Parquet particionado "
+                    "(leia depois com pandas.read_parquet(<saída>))"
+    )
+    parser.add_argument('--banks', default=",".join(profiles.names()), help="Bancos separados por vírgula")
+    parser.add_argument('--years', default=None, help="Anos separados por vírgula ou intervalo (ex: 2022..2025); padrão: todos")
+    parser.add_argument('--output', default="data/transactions", help="Diretório raiz do Parquet")
+    parser.add_argument('--local-dir', default=None, help="Espelho local das pastas do Drive (<banco>/<ano>[/<mês>])")
+    parser.add_argument('--jobs', type=int, default=4, help="Pastas processadas em paralelo")
+    parser.add_argument('--ocr-workers', type=int, default=None, help="Processos do pool de OCR compartilhado")
+    parser.add_argument('--stitch', action='store_true', help="Só faz OCR da parte nova de cada print (prints sobrepostos)")
+    parser.add_argument('--restart', action='store_true', help="Ignora o checkpoint e processa tudo de novo")
+    args = parser.parse_args()
+
+    if args.ocr_workers is not None:
+        ocr.workers = args.ocr_workers
+    if args.stitch:
+        stitcher.enabled = True
+
+    years = None
+    if args.years:
+        years = []
+        for part in args.years.split(','):
+            if '..' in part:
+                first, last = part.split('..', 1)
+                years.extend(str(year) for year in range(int(first), int(last) + 1))
+            elif part.strip():
+                years.append(part.strip())
+
+    banks = [bank.strip() for bank in args.banks.split(',') if bank.strip()]
+    backfill = Backfill(args.output, args.local_dir, args.restart)
+    if args.local_dir:
+        units = backfill.discover_local_units(banks, years)
+    else:
+        units = backfill.discover_drive_units(banks, years)
+
+    failures = backfill.run(units, args.jobs)
+    ocr.shutdown_pool()
+    if failures:
+        print(f"{failures} unidades falharam; rode de novo para retomar a partir do checkpoint")
+        sys.exit(1)
@@ -0,0 +1,65 @@
+import copy
+import json
+import os
+
+# Perfis declarativos por banco: formatos do texto extraído e layout da planilha.
+# Para incluir um banco novo basta acrescentar um perfil aqui ou em um JSON
+# apontado por FINANCETRACK_BANK_PROFILES (mesmas chaves). A gramática de cada
+# transação (valor "R$ X,XX", "Parcela N de M") é a mesma para todos os bancos e
+# fica nos padrões do transaction_parser; o perfil define a data que abre a transação.
+BANK_PROFILES = {
+    'c6': {
+        # Linha que inicia uma transação
+        'date_format': r'\d{2}/\d{2}',
+        # Padrões auxiliares usados pelo parser antigo (extract_transactions_from_textt)
+        'extra_formats': [],
+        # Linhas descartadas antes do agrupamento
+        'noise_prefixes': ['Cartão', 'Cartão Virtual', 'Cartaio Vinal', 'Subtotal', '——', 'EI Cartão', 'Inclusão de Pagamento', 'USD'],
+        # Linhas ignoradas dentro de uma transação
+        'skip_prefixes': ['Em processamento'],
+        # Correções de OCR aplicadas a cada linha
+        'replacements': [['RS ', 'R$ '], ['Rs ', 'R$ ']],
+        # Faixas fixas do print (fração da altura) descartadas antes do OCR nos presets balanced/fast
+        'screenshot': {'header_band': 0.08, 'footer_band': 0.05},
+        'sheet': {'name': 'Financeiro', 'start_row': 39, 'col_descricao': 3, 'col_valor': 4}
+    },
+    'xp': {
+        'date_format': r'\d{2}/\d{2}/\d{4}',
+        'extra_formats': [r'\d{2}\.\d{2}'],
+        'noise_prefixes': ['Cartão', 'Cartão Virtual', 'Cartaio Vinal', 'Subtotal', '——', 'EI Cartão', 'Inclusão de Pagamento', 'USD'],
+        'skip_prefixes': ['Em processamento'],
+        'replacements': [['RS ', 'R$ '], ['Rs ', 'R$ ']],
+        'screenshot': {'header_band': 0.08, 'footer_band': 0.05},
+        'sheet': {'name': 'Financeiro', 'start_row': 25, 'col_descricao': 7, 'col_valor': 8}
+    }
+}
+
+class BankProfiles:
+
+    profiles = None
+
+    @classmethod
+    def load(self):
+        if self.profiles is None:
+            profiles = copy.deepcopy(BANK_PROFILES)
+            extra_path = os.environ.get('FINANCETRACK_BANK_PROFILES')
+            if extra_path:
+                with open(extra_path, 'r', encoding='utf-8') as fh:
+                    for bank, profile in json.load(fh).items():
+                        # Perfis externos herdam o que não declararem do perfil c6
+                        merged = copy.deepcopy(profiles.get(bank, BANK_PROFILES['c6']))
+                        merged.update(profile)
+                        profiles[bank] = merged
+            self.profiles = profiles
+        return self.profiles
+
+    @classmethod
+    def get(self, bank):
+        profiles = self.load()
+        if bank not in profiles:
+            raise ValueError(f"Banco sem perfil configurado: {bank}")
+        return profiles[bank]
+
+    @classmethod
+    def names(self):
+        return list(self.load())
@@ -0,0 +1,164 @@
+import hashlib
+import re
+from gspread.utils import a1_to_rowcol
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+
+class FakeRequest:
+
+    def __init__(self, execute=None, http=None, uri=None):
+        self._execute = execute
+        # Atributos usados pelo MediaIoBaseDownload
+        self.http = http
+        self.uri = uri
+        self.headers = {}
+
+    def execute(self, *args, **kwargs):
+        return self._execute()
+
+class FakeResponse(dict):
+
+    def __init__(self, content):
+        super().__init__({'status': '200', 'content-length': str(len(content))})
+        self.status = 200
+        self.reason = 'OK'
+
+class FakeHttp:
+
+    def __init__(self, drive):
+        self.drive = drive
+
+    def request(self, uri, method="GET", **kwargs):
+        content = self.drive.files_by_id[uri.rsplit('/', 1)[1]]['content']
+        return FakeResponse(content), content
+
+class FakeFiles:
+
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q='', pageSize=100, pageToken=None, fields=None, **kwargs):
+        def execute():
+            items = [item for item in self.drive.files_by_id.values() if self.drive.matches(item, q)]
+            items.sort(key=lambda item: item['name'])
+            start = int(pageToken or 0)
+            page = items[start:start + pageSize]
+            result = {'files': [self.drive.public(item) for item in page]}
+            if start + pageSize < len(items):
+                result['nextPageToken'] = str(start + pageSize)
+            return result
+        return FakeRequest(execute)
+
+    def get_media(self, fileId):
+        return FakeRequest(http=FakeHttp(self.drive), uri=f"fake://drive/{fileId}")
+
+class FakeChanges:
+
+    def getStartPageToken(self):
+        return FakeRequest(lambda: {'startPageToken': '1'})
+
+    def list(self, pageToken=None, **kwargs):
+        return FakeRequest(lambda: {'changes': [], 'newStartPageToken': pageToken})
+
+class FakeDrive:
+    # Imita o subconjunto do serviço 'drive' v3 usado pelo GoogleManager
+
+    def __init__(self):
+        self.files_by_id = {}
+        self.next_id = 0
+
+    def add(self, name, parent_id=None, mime_type=FOLDER_MIME, content=None):
+        self.next_id += 1
+        file_id = f"fake{self.next_id}"
+        self.files_by_id[file_id] = {
+            'id': file_id,
+            'name': name,
+            'mimeType': mime_type,
+            'parents': [parent_id] if parent_id else [],
+            'md5Checksum': hashlib.md5(content).hexdigest() if content is not None else None,
+            'modifiedTime': '2026-01-01T00:00:00.000Z',
+            'content': content
+        }
+        return file_id
+
+    def public(self, item):
+        return {key: value for key, value in item.items() if key != 'content' and value is not None}
+
+    def matches(self, item, query):
+        parent = re.search(r"'([^']+)' in parents", query)
+        if parent and parent.group(1) not in item['parents']:
+            return False
+        name = re.search(r"name='([^']*)'", query)
+        if name and name.group(1) != item['name']:
+            return False
+        # Condições de mimeType entre parênteses e ligadas por "or" bastam uma
+        alternatives = re.search(r"\(([^)]*mimeType[^)]*)\)", query)
+        clauses = alternatives.group(1).split(' or ') if alternatives else [query]
+        return any(self.matches_mime(item, clause) for clause in clauses)
+
+    def matches_mime(self, item, query):
+        mime = re.search(r"mimeType\s*=\s*'([^']+)'", query)
+        if mime and mime.group(1) != item['mimeType']:
+            return False
+        contains = re.search(r"mimeType contains '([^']+)'", query)
+        if contains and contains.group(1) not in item['mimeType']:
+            return False
+        return True
+
+    def files(self):
+        return FakeFiles(self)
+
+    def changes(self):
+        return FakeChanges()
+
+class FakeSpreadsheet:
+    # Planilha em memória com values_batch_get / values_batch_update
+
+    def __init__(self):
+        self.cells = {}
+        self.calls = []
+
+    def parse_range(self, a1_range):
+        title, cells = a1_range.rsplit('!', 1)
+        title = title.strip("'").replace("''", "'")
+        first, last = cells.split(':')
+        return title, a1_to_rowcol(first), a1_to_rowcol(last)
+
+    def values_batch_get(self, ranges, params=None):
+        self.calls.append(('batch_get', len(ranges)))
+        value_ranges = []
+        for a1_range in ranges:
+            title, (row1, col1), (row2, col2) = self.parse_range(a1_range)
+            values = [
+                [self.cells.get((title, row, col), '') for col in range(col1, col2 + 1)]
+                for row in range(row1, row2 + 1)
+            ]
+            value_ranges.append({'range': a1_range, 'values': values})
+        return {'valueRanges': value_ranges}
+
+    def values_batch_update(self, body):
+        self.calls.append(('batch_update', len(body['data'])))
+        for entry in body['data']:
+            title, (row1, col1), _ = self.parse_range(entry['range'])
+            for row_offset, row_values in enumerate(entry['values']):
+                for col_offset, value in enumerate(row_values):
+                    self.cells[(title, row1 + row_offset, col1 + col_offset)] = value
+        return {}
+
+    def worksheet(self, title):
+        return FakeWorksheet(self, title)
+
+class FakeWorksheet:
+
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.title = title
+
+def install(drive, spreadsheet):
+    # Redireciona a sessão do Google para os backends locais
+    from google_session import GoogleSession
+
+    GoogleSession.get_drive_service = classmethod(lambda cls, credentials_path: drive)
+    GoogleSession.open_spreadsheet = classmethod(lambda cls, credentials_path, sheet_name: spreadsheet)
+    GoogleSession.get_cached_folder = classmethod(lambda cls, folder_path: None)
+    GoogleSession.set_cached_folder = classmethod(lambda cls, folder_path, folder_id: None)
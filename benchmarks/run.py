@@ -0,0 +1,233 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fakes
+from benchmarks.synthetic import SyntheticStatements
+from google_manager import GoogleManager as gdrive
+from ocr_cache import OcrCache as cache
+from ocr_processor import OcrProcessor as ocr
+from screenshot_stitcher import ScreenshotStitcher as stitcher
+from sheets_writer import SheetsWriter as writer
+from utils import Utils as utils
+
+# Métricas comparadas com o baseline: (nome, True se maior é melhor)
+COMPARED_METRICS = [('p50_ms', False), ('p95_ms', False), ('throughput', True)]
+
+class BenchmarkRunner:
+
+    def __init__(self, args):
+        self.args = args
+        self.results = {}
+        # Verificações de corretude (falham a execução mesmo sem baseline)
+        self.errors = []
+
+    def percentile(values, fraction):
+        ordered = sorted(values)
+        index = max(0, math.ceil(fraction * len(ordered)) - 1)
+        return ordered[index]
+
+    def measure(self, name, items, func):
+        items = list(items) * self.args.repeat
+        if not items:
+            return
+
+        # 1ª passada: tempo (sem tracemalloc, que distorce a latência)
+        latencies = []
+        started = time.perf_counter()
+        for item in items:
+            item_started = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter() - item_started)
+        elapsed = time.perf_counter() - started
+
+        # 2ª passada: pico de memória alocada pelo Python (tensores do torch não entram)
+        peak_mb = None
+        if not self.args.no_memory:
+            tracemalloc.start()
+            for item in items[:max(1, len(items) // self.args.repeat)]:
+                func(item)
+            peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+
+        self.results[name] = {
+            'items': len(items),
+            'seconds': round(elapsed, 6),
+            'throughput': round(len(items) / elapsed, 3) if elapsed else None,
+            'p50_ms': round(BenchmarkRunner.percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(BenchmarkRunner.percentile(latencies, 0.95) * 1000, 3),
+            'peak_mb': round(peak_mb, 3) if peak_mb is not None else None
+        }
+
+    def get_ocr_accuracy(self, bank, statement_text, contents):
+        # Fração das transações da fatura sintética recuperadas idênticas pelo OCR
+        expected = ocr.extract_transactions_from_text(statement_text, bank)
+        texts = ocr.extract_texts_from_images(contents, bank_name=bank, use_cache=False)
+        found = set(ocr.extract_transactions_from_text("".join(text + "\n" for text in texts), bank))
+        return round(sum(transaction in found for transaction in expected) / len(expected), 4) if expected else None
+
+    def check_stitch(self, bank, contents):
+        # Prints de rolagem se sobrepõem em toda emenda; prints independentes (--overlap 0) em
+        # nenhuma: uma sobreposição falsa cortaria transações antes do OCR
+        stats = {}
+        list(stitcher.iter_regions(contents, bank, stats))
+        expected = len(contents) - 1 if self.args.overlap else 0
+        found = stats.get('overlaps', 0)
+        self.results[f"{bank}.stitch"]['overlaps'] = found
+        if found != expected:
+            self.errors.append(f"{bank}.stitch: {found} sobreposições detectadas, esperadas {expected}")
+
+    def build_drive(self, bank, statement_text, generator):
+        # Financeiro/<banco>/<ano> com os prints sintéticos
+        drive = fakes.FakeDrive()
+        base_id = drive.add('Financeiro')
+        bank_id = drive.add(bank, base_id)
+        year_id = drive.add(str(self.args.year), bank_id)
+        if self.args.overlap:
+            # Prints de rolagem, com cabeçalho fixo e sobreposição entre telas consecutivas
+            screenshots = generator.render_scroll(statement_text, self.args.overlap)
+        else:
+            screenshots = [generator.render_screenshot(chunk) for chunk in generator.split_screenshots(statement_text, self.args.images)]
+        for index, content in enumerate(screenshots):
+            drive.add(f"{index:03d}.png", year_id, 'image/png', content)
+        return drive, year_id
+
+    def run_bank(self, bank):
+        generator = SyntheticStatements(self.args.seed)
+        statement_text = generator.make_statement(bank, self.args.transactions, self.args.year)
+        start_row, col_descricao, col_valor = utils.get_first_line(bank)
+        stages = self.args.stages
+
+        spreadsheet = fakes.FakeSpreadsheet()
+        if 'drive_download' in stages or 'ocr' in stages or 'stitch' in stages:
+            drive, folder_id = self.build_drive(bank, statement_text, generator)
+            fakes.install(drive, spreadsheet)
+            images = gdrive.list_images_from_drive(folder_id, gdrive.credentials_path)
+
+            if 'drive_download' in stages:
+                self.measure(f"{bank}.drive_download", images,
+                             lambda item: gdrive.download_file(item, gdrive.credentials_path))
+            contents = [drive.files_by_id[item['id']]['content'] for item in images]
+            if 'stitch' in stages:
+                self.measure(f"{bank}.stitch", [contents], lambda items: list(stitcher.iter_regions(items, bank)))
+                self.check_stitch(bank, contents)
+            if 'ocr' in stages:
+                cache.enabled = False
+                self.measure(f"{bank}.ocr", contents, lambda content: ocr.extract_text_from_image(content))
+                self.results[f"{bank}.ocr"]['accuracy'] = self.get_ocr_accuracy(bank, statement_text, contents)
+        else:
+            fakes.install(fakes.FakeDrive(), spreadsheet)
+
+        transactions = ocr.extract_transactions_from_text(statement_text, bank)
+        df = ocr.parse_credit_card_statement(transactions, bank, self.args.year)
+
+        if 'extract_transactions' in stages:
+            self.measure(f"{bank}.extract_transactions", [statement_text],
+                         lambda text: ocr.extract_transactions_from_text(text, bank))
+        if 'parse_statement' in stages:
+            self.measure(f"{bank}.parse_statement", [transactions],
+                         lambda items: ocr.parse_credit_card_statement(items, bank, self.args.year))
+        if 'sheet_payload' in stages:
+            self.measure(f"{bank}.sheet_payload", [df], gdrive.build_sheet_payload)
+        if 'sheet_write' in stages:
+            def write(frame):
+                # Planilha vazia a cada repetição: mede a escrita completa
+                spreadsheet.cells.clear()
+                writer.reset_budget()
+                gdrive.update_specific_cells_batch(frame, utils.get_sheet_name(bank), "Fev", start_row, col_descricao, col_valor)
+            self.measure(f"{bank}.sheet_write", [df], write)
+
+    def compare(self, baseline, tolerance):
+        regressions = []
+        for name, result in self.results.items():
+            reference = baseline.get(name)
+            if not reference:
+                continue
+            for metric, higher_is_better in COMPARED_METRICS:
+                old, new = reference.get(metric), result.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                if (change < -tolerance) if higher_is_better else (change > tolerance):
+                    regressions.append(f"{name}.{metric}: {old} -> {new} ({change:+.1%})")
+        return regressions
+
+    def print_report(self):
+        print(f"{'estágio':<28} {'itens':>6} {'itens/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'pico MB':>9}")
+        for name, result in self.results.items():
+            peak = '-' if result['peak_mb'] is None else f"{result['peak_mb']:.2f}"
+            accuracy = f"  acerto {result['accuracy']:.1%}" if result.get('accuracy') is not None else ""
+            print(
+                f"{name:<28} {result['items']:>6} {result['throughput'] or 0:>10.2f} "
+                f"{result['p50_ms']:>10.3f} {result['p95_ms']:>10.3f} {peak:>9}{accuracy}"
+            )
+
+
+STAGES = ['drive_download', 'stitch', 'ocr', 'extract_transactions', 'parse_statement', 'sheet_payload', 'sheet_write']
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline com Drive e Sheets locais")
+    parser.add_argument('--banks', default="c6,xp", help="Bancos separados por vírgula")
+    parser.add_argument('--transactions', type=int, default=200, help="Transações por fatura sintética")
+    parser.add_argument('--images', type=int, default=10, help="Prints por fatura sintética")
+    parser.add_argument('--overlap', type=float, default=0.0, help="Fração de sobreposição entre prints (0: prints independentes)")
+    parser.add_argument('--repeat', type=int, default=5, help="Repetições de cada estágio")
+    parser.add_argument('--year', type=int, default=2026)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--stages', default=",".join(STAGES), help="Estágios a medir")
+    parser.add_argument('--skip-ocr', action='store_true', help="Não mede o EasyOCR (estágio mais lento)")
+    parser.add_argument('--ocr-mode', default=None, choices=['default', 'fast_cpu'], help="Modo de inferência do EasyOCR")
+    parser.add_argument('--ocr-threads', type=int, default=None, help="Threads do torch para o OCR")
+    parser.add_argument('--ocr-canvas-size', type=int, default=None, help="Maior lado da imagem no detector do EasyOCR")
+    parser.add_argument('--ocr-batch-size', type=int, default=None, help="Recortes por lote no reconhecedor do EasyOCR")
+    parser.add_argument('--ocr-paragraph', action=argparse.BooleanOptionalAction, default=None, help="Junta as caixas próximas em parágrafos")
+    parser.add_argument('--ocr-allowlist', default=None, help="Caracteres aceitos pelo reconhecedor ('digits': só valores e datas)")
+    parser.add_argument('--ocr-quantize', action=argparse.BooleanOptionalAction, default=None, help="Quantização dinâmica do modelo na CPU")
+    parser.add_argument('--preprocess', default=None, help="Preset de pré-processamento das imagens")
+    parser.add_argument('--no-memory', action='store_true', help="Não mede o pico de memória")
+    parser.add_argument('--output', help="Salva os resultados em JSON (use como baseline depois)")
+    parser.add_argument('--baseline', help="JSON de uma execução anterior para comparação")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Piora tolerada antes de acusar regressão")
+    args = parser.parse_args()
+
+    args.stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    if args.skip_ocr and 'ocr' in args.stages:
+        args.stages.remove('ocr')
+
+    if args.preprocess is not None:
+        ocr.preprocess = args.preprocess
+    ocr_overrides = {
+        'mode': args.ocr_mode, 'threads': args.ocr_threads, 'canvas_size': args.ocr_canvas_size,
+        'batch_size': args.ocr_batch_size, 'paragraph': args.ocr_paragraph,
+        'allowlist': args.ocr_allowlist, 'quantize': args.ocr_quantize
+    }
+    if any(value is not None for value in ocr_overrides.values()):
+        ocr.configure(**ocr_overrides)
+
+    runner = BenchmarkRunner(args)
+    for bank in [bank.strip() for bank in args.banks.split(',') if bank.strip()]:
+        runner.run_bank(bank)
+    runner.print_report()
+    for error in runner.errors:
+        print(f"ERRO {error}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            json.dump(runner.results, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as fh:
+            regressions = runner.compare(json.load(fh), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSÃO {regression}")
+        if regressions:
+            sys.exit(1)
+
+    if runner.errors:
+        sys.exit(1)
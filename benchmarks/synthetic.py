@@ -0,0 +1,120 @@
+import io
+import random
+
+# Vocabulário das descrições sintéticas (parecido com o que aparece nas faturas)
+MERCHANTS = [
+    "UBER *TRIP", "IFOOD *RESTAURANTE", "PG 'B4A GLAMBOX", "APP 'MONTISTUDIO", "MERCADO LIVRE",
+    "PADARIA CENTRAL", "POSTO SHELL", "FARMACIA DROGASIL", "NETFLIX.COM", "SPOTIFY", "AMAZON MARKETPLACE",
+    "SUPERMERCADO DIA", "CINEMARK", "LOJAS RENNER", "DECOLAR", "RAIA DROGASIL"
+]
+
+class SyntheticStatements:
+
+    def __init__(self, seed=42):
+        self.random = random.Random(seed)
+
+    def format_amount(self, cents):
+        reais, centavos = divmod(cents, 100)
+        inteiro = f"{reais:,}".replace(',', '.')
+        return f"R$ {inteiro},{centavos:02d}"
+
+    def make_transaction(self, bank, year):
+        day = self.random.randint(1, 28)
+        month = self.random.randint(1, 12)
+        cents = self.random.randint(100, 250000)
+        description = f"{self.random.choice(MERCHANTS)} {self.random.randint(1, 999)}"
+        installment = None
+        if self.random.random() < 0.25:
+            total = self.random.randint(2, 12)
+            installment = (self.random.randint(1, total), total)
+
+        if bank == "xp":
+            date = f"{day:02d}/{month:02d}/{year}"
+        else:
+            date = f"{day:02d}/{month:02d}"
+        return {'date': date, 'description': description, 'amount': self.format_amount(cents), 'installment': installment}
+
+    def transaction_lines(self, transaction, bank):
+        # Linhas na ordem em que o readtext costuma devolver cada bloco da fatura
+        lines = [transaction['date'], transaction['description']]
+        if bank == "xp" and transaction['installment']:
+            lines.append(f"Parcela {transaction['installment'][0]} de {transaction['installment'][1]}")
+        lines.append(transaction['amount'])
+        if bank != "xp" and transaction['installment']:
+            lines.append(f"Parcela {transaction['installment'][0]} de {transaction['installment'][1]}")
+        if self.random.random() < 0.05:
+            lines.append("Em processamento")
+        return lines
+
+    def make_statement(self, bank, transactions, year=2026):
+        # Texto cru do OCR de uma fatura, já com ruído típico (cabeçalhos, subtotais)
+        lines = ["Cartão Virtual final 1234"]
+        for index in range(transactions):
+            if index and index % 15 == 0:
+                lines.append(f"Subtotal {self.format_amount(self.random.randint(1000, 900000))}")
+            lines.extend(self.transaction_lines(self.make_transaction(bank, year), bank))
+        return "\n".join(lines)
+
+    def split_screenshots(self, text, images, overlap=0):
+        # Divide as linhas em blocos, um por print de tela; com overlap, cada print repete
+        # as últimas linhas do anterior (como acontece ao rolar a fatura)
+        lines = text.split("\n")
+        size = max(1, -(-len(lines) // images))
+        return ["\n".join(lines[max(0, i - overlap):i + size]) for i in range(0, len(lines), size)]
+
+    def get_font(self):
+        from PIL import ImageFont
+
+        try:
+            return ImageFont.load_default(size=40)
+        except TypeError:
+            return ImageFont.load_default()
+
+    def draw_header(self, image, width, header):
+        from PIL import ImageDraw
+
+        draw = ImageDraw.Draw(image)
+        draw.rectangle([0, 0, width, header - 40], fill=(40, 40, 40))
+        draw.text((40, 60), "Fatura do cartão", fill='white', font=self.get_font())
+
+    def to_png(self, image):
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def render_screenshot(self, text, width=1080, line_height=64):
+        # Renderiza o texto como um print de celular (PNG em memória)
+        from PIL import Image, ImageDraw
+
+        lines = text.split("\n")
+        header = 220
+        image = Image.new('RGB', (width, header + line_height * (len(lines) + 2)), 'white')
+        self.draw_header(image, width, header)
+        draw = ImageDraw.Draw(image)
+        font = self.get_font()
+        for index, line in enumerate(lines):
+            draw.text((60, header + index * line_height), line, fill='black', font=font)
+        return self.to_png(image)
+
+    def render_scroll(self, text, overlap=0.3, screen_height=2000, width=1080, line_height=64):
+        # Prints tirados rolando a fatura: cabeçalho fixo e cada tela repetindo a fração
+        # overlap do fim da anterior, com linhas cortadas pelas bordas
+        from PIL import Image, ImageDraw
+
+        lines = text.split("\n")
+        header = 220
+        content = Image.new('RGB', (width, line_height * (len(lines) + 1)), 'white')
+        draw = ImageDraw.Draw(content)
+        font = self.get_font()
+        for index, line in enumerate(lines):
+            draw.text((60, index * line_height + line_height // 4), line, fill='black', font=font)
+
+        visible = screen_height - header
+        step = max(1, int(visible * (1 - overlap)))
+        screenshots = []
+        for top in range(0, max(1, content.height - visible + step), step):
+            screen = Image.new('RGB', (width, screen_height), 'white')
+            screen.paste(content.crop((0, top, width, min(content.height, top + visible))), (0, header))
+            self.draw_header(screen, width, header)
+            screenshots.append(self.to_png(screen))
+        return screenshots
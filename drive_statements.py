@@ -0,0 +1,108 @@
+import heapq
+import os
+from google_manager import GoogleManager as gdrive
+from instrumentation import Instrumentation as instrumentation
+from ocr_processor import OcrProcessor as ocr
+from pdf_extractor import PdfExtractor as pdf
+from screenshot_stitcher import ScreenshotStitcher as stitcher
+
+class DriveStatements:
+    # Download e extração do texto dos arquivos de fatura (prints e PDFs) de uma pasta do Drive
+
+    def clear_local_dir(local_dir):
+        for arquivo in os.listdir(local_dir):
+            caminho_arquivo = os.path.join(local_dir, arquivo)
+            if os.path.isfile(caminho_arquivo):
+                os.remove(caminho_arquivo)
+
+    @classmethod
+    def iter_images(self, bank, items, in_memory=True, local_dir=None, skip_cached=True):
+        # Gera (item, imagem) na ordem de items; a imagem é None quando o OCR já está no cache.
+        # Os downloads correm em paralelo, com janela limitada, enquanto o consumidor faz o OCR.
+        pending = [item for item in items if not (skip_cached and ocr.is_cached(gdrive.get_content_id(item), bank))]
+        pending_ids = {item['id'] for item in pending}
+        downloads = gdrive.iter_images_from_drive(pending, gdrive.credentials_path, None if in_memory else local_dir)
+
+        for item in items:
+            if item['id'] not in pending_ids:
+                yield item, None
+                continue
+            with instrumentation.stage('download', items=1) as span:
+                _, data = next(downloads)
+                if not in_memory:
+                    data = os.path.join(local_dir, data)
+                span['bytes'] = len(data) if in_memory else os.path.getsize(data)
+            yield item, data
+
+    @classmethod
+    def iter_detections(self, bank, items, in_memory=True, local_dir=None):
+        # Gera (item, detecções) na ordem de items: cada print vai para o OCR assim que chega
+        local_dir = local_dir or f"./{bank}"
+
+        if not in_memory:
+            os.makedirs(local_dir, exist_ok=True)
+            self.clear_local_dir(local_dir)
+
+        if stitcher.enabled:
+            # O recorte de cada print depende dos vizinhos: todos são baixados e a chave do
+            # cache de OCR passa a ser o conteúdo do recorte
+            stats = {}
+            images = self.iter_images(bank, items, in_memory, local_dir, skip_cached=False)
+            regions = stitcher.iter_regions((data for _, data in images), bank, stats)
+            entries = ((region, stitcher.get_region_id(region), item['id']) for item, region in zip(items, regions))
+        else:
+            images = self.iter_images(bank, items, in_memory, local_dir)
+            entries = ((data, gdrive.get_content_id(item), item['id']) for item, data in images)
+
+        # Detecções (caixa, texto, confiança), em paralelo se OcrProcessor.workers > 1
+        detections = ocr.iter_detections_from_images(entries, bank_name=bank, crop_bands=not stitcher.enabled)
+        for item, image_detections in zip(items, detections):
+            yield item, image_detections
+
+        if stitcher.enabled:
+            instrumentation.count('stitch_overlaps', stats.get('overlaps', 0))
+            instrumentation.count('stitch_skipped_rows', stats.get('skipped_rows', 0))
+
+        if not in_memory:
+            self.clear_local_dir(local_dir)
+
+    @classmethod
+    def iter_pdf_texts(self, bank, items, in_memory=True, local_dir=None):
+        # Gera (item, detecções, texto) de cada PDF: a camada de texto é lida página a página e só
+        # as páginas sem texto passam pelo OCR (as detecções são as dessas páginas)
+        pdf_dir = None
+        if not in_memory:
+            # Subpasta própria: iter_detections limpa local_dir enquanto os PDFs ainda são lidos
+            pdf_dir = os.path.join(local_dir or f"./{bank}", 'pdf')
+            os.makedirs(pdf_dir, exist_ok=True)
+        downloads = gdrive.iter_images_from_drive(items, gdrive.credentials_path, pdf_dir)
+
+        for item in items:
+            with instrumentation.stage('download', items=1) as span:
+                _, data = next(downloads)
+                source = data if in_memory else os.path.join(pdf_dir, data)
+                span['bytes'] = len(data) if in_memory else os.path.getsize(source)
+            with instrumentation.stage('pdf', items=1):
+                text, detections = pdf.extract(source, gdrive.get_content_id(item), item['id'], bank)
+            if not in_memory:
+                os.remove(source)
+            yield item, detections, text
+
+    @classmethod
+    def iter_file_texts(self, bank, items, in_memory=True, local_dir=None):
+        # Gera (item, detecções, texto) na ordem de items (por nome), com prints e PDFs misturados
+        images = [item for item in items if not pdf.is_pdf(item)]
+        pdfs = [item for item in items if pdf.is_pdf(item)]
+        streams = []
+        if images:
+            streams.append(
+                (item, image_detections, ocr.get_text(image_detections))
+                for item, image_detections in self.iter_detections(bank, images, in_memory, local_dir)
+            )
+        if pdfs:
+            streams.append(self.iter_pdf_texts(bank, pdfs, in_memory, local_dir))
+        return heapq.merge(*streams, key=lambda entry: entry[0]['name'])
+
+    @classmethod
+    def extract_texts(self, bank, items, in_memory=True, local_dir=None):
+        return [text for _, _, text in self.iter_file_texts(bank, items, in_memory, local_dir)]
@@ -1,166 +1,264 @@
 import io
 import os
-import gspread
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from oauth2client.service_account import ServiceAccountCredentials
+from concurrent.futures import ThreadPoolExecutor
+from google_session import GoogleSession as session
+from ledger import Ledger as ledger
+from sheets_writer import SheetsWriter as writer
 
 class GoogleManager:
 
     credentials_path = 'credencial_google.json'
+    download_workers = 4
     
-    def download_images_from_drive(folder_id, local_dir, credentials_path):
-        # Escopos combinados (Sheets + Drive)
-        SCOPES = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive.readonly'
-        ]
-        
-        # Autenticação (mesmo método do update_specific_cells_batch)
-        creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_path, scopes=SCOPES)
-        
-        # Cria serviço do Drive
-        service = build('drive', 'v3', credentials=creds)
-        
-        # Cria diretório local se não existir
-        os.makedirs(local_dir, exist_ok=True)
-        
-        # Busca arquivos na pasta
-        query = f"'{folder_id}' in parents and mimeType contains 'image/'"
-        results = service.files().list(
-            q=query,
-            pageSize=20,
-            fields="nextPageToken, files(id, name, mimeType)"
-        ).execute()
-        
-        items = results.get('files', [])
-        
-        if not items:
-            print('Nenhuma imagem encontrada na pasta.', folder_id, local_dir)
-            return
-        
-        file_names = []
+    def get_drive_service(credentials_path):
+        # Credencial, documento de descoberta e conexão HTTP são reaproveitados pela sessão
+        return session.get_drive_service(credentials_path)
+
+    @classmethod
+    def list_files_from_drive(self, query, credentials_path, service=None):
+        if service is None:
+            service = self.get_drive_service(credentials_path)
+
+        # Percorre todas as páginas (md5Checksum identifica o conteúdo para o cache de OCR)
+        items = []
+        page_token = None
+        while True:
+            results = service.files().list(
+                q=query,
+                pageSize=100,
+                pageToken=page_token,
+                fields="nextPageToken, files(id, name, mimeType, md5Checksum, modifiedTime)"
+            ).execute()
+            items.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
         
-        # Download de cada imagem
-        for item in items:
-            file_name = item['name']
-            file_names.append(file_name)
-            request = service.files().get_media(fileId=item['id'])
+        return items
+
+    @classmethod
+    def list_images_from_drive(self, folder_id, credentials_path, service=None):
+        query = f"'{folder_id}' in parents and mimeType contains 'image/' and trashed=false"
+        return self.list_files_from_drive(query, credentials_path, service)
+
+    @classmethod
+    def list_statement_files_from_drive(self, folder_id, credentials_path, service=None):
+        # Prints e faturas em PDF (exportadas pelo app do banco) da mesma pasta
+        query = f"'{folder_id}' in parents and (mimeType contains 'image/' or mimeType = 'application/pdf') and trashed=false"
+        return self.list_files_from_drive(query, credentials_path, service)
+
+    @classmethod
+    def list_subfolders_from_drive(self, folder_id, credentials_path, service=None):
+        query = f"'{folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        return self.list_files_from_drive(query, credentials_path, service)
+
+    @classmethod
+    def get_changes_start_token(self, credentials_path, service=None):
+        if service is None:
+            service = self.get_drive_service(credentials_path)
+        return service.changes().getStartPageToken().execute()['startPageToken']
+
+    @classmethod
+    def list_changes_from_drive(self, page_token, credentials_path, service=None):
+        # Retorna as alterações desde page_token e o token para a próxima sincronização
+        if service is None:
+            service = self.get_drive_service(credentials_path)
+
+        changes = []
+        while True:
+            results = service.changes().list(
+                pageToken=page_token,
+                pageSize=1000,
+                includeRemoved=True,
+                fields="nextPageToken, newStartPageToken, changes(fileId, removed, file(id, name, mimeType, md5Checksum, modifiedTime, parents, trashed))"
+            ).execute()
+            changes.extend(results.get('changes', []))
+            if 'newStartPageToken' in results:
+                return changes, results['newStartPageToken']
+            page_token = results['nextPageToken']
+
+    def get_content_id(item):
+        # Arquivos binários do Drive sempre têm md5Checksum; o id é só um fallback
+        return item.get('md5Checksum') or item['id']
+
+    @classmethod
+    def download_file(self, item, credentials_path, local_dir=None):
+        from googleapiclient.http import MediaIoBaseDownload
+
+        service = self.get_drive_service(credentials_path)
+        request = service.files().get_media(fileId=item['id'])
+
+        # Sem local_dir, o arquivo fica só em memória
+        if local_dir is None:
+            fh = io.BytesIO()
+        else:
             fh = io.FileIO(os.path.join(local_dir, item['name']), 'wb')
+
+        with fh:
             downloader = MediaIoBaseDownload(fh, request)
-            
             done = False
             while not done:
                 status, done = downloader.next_chunk()
                 # print(f"Download {int(status.progress() * 100)}% - {item['name']}")
+            if local_dir is None:
+                return fh.getvalue()
+        return item['name']
+
+    @classmethod
+    def iter_images_from_drive(self, items, credentials_path, local_dir=None, max_workers=None):
+        # Gera (item, bytes ou nome do arquivo) na ordem de items, com no máximo
+        # max_workers downloads simultâneos e uma janela limitada de resultados pendentes
+        max_workers = max_workers or self.download_workers
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = []
+            for item in items:
+                pending.append((item, executor.submit(self.download_file, item, credentials_path, local_dir)))
+                if len(pending) >= max_workers * 2:
+                    first, future = pending.pop(0)
+                    yield first, future.result()
+            for item, future in pending:
+                yield item, future.result()
+
+    @classmethod
+    def download_images_from_drive(self, folder_id, local_dir, credentials_path, items=None, in_memory=False, max_workers=None):
+        # Sem lista explícita, baixa todas as imagens da pasta
+        if items is None:
+            items = self.list_images_from_drive(folder_id, credentials_path)
+        
+        if not items:
+            print('Nenhuma imagem encontrada na pasta.', folder_id, local_dir)
+            return
+        
+        if in_memory:
+            # Retorna [(nome, bytes)], sem passar pelo disco
+            return [
+                (item['name'], data)
+                for item, data in self.iter_images_from_drive(items, credentials_path, max_workers=max_workers)
+            ]
+
+        # Cria diretório local se não existir
+        os.makedirs(local_dir, exist_ok=True)
+        
+        file_names = [
+            file_name
+            for _, file_name in self.iter_images_from_drive(items, credentials_path, local_dir, max_workers)
+        ]
         
         # print(f"\n{len(items)} imagens salvas em: {os.path.abspath(local_dir)}")        
         return file_names
 
     @classmethod
-    def get_folder_id_from_bank_name(self, year, bank_name):
+    def get_folder_id_from_bank_name(self, year, bank_name, month=None):
         # Exemplo de uso:
         folder_id = self.find_folder_id(
             credentials_path=self.credentials_path,
             base_folder_name='Financeiro',
             year=year,
-            bank_name=bank_name
+            bank_name=bank_name,
+            month=month
         )
         
         return folder_id   
 
-    def find_folder_id(credentials_path, base_folder_name, year, bank_name=None):
-        # Configuração da API
-        SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
-        creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_path, scopes=SCOPES)
-        service = build('drive', 'v3', credentials=creds)
-        
-        # Primeiro encontra a pasta base (Financeiro)
-        base_folder_id = None
-        results = service.files().list(
-            q=f"name='{base_folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            pageSize=1,
-            fields="files(id, name)"
-        ).execute()
-        
-        if not results.get('files'):
-            print(f"❌ Pasta base '{base_folder_name}' não encontrada")
-            return None
-        
-        base_folder_id = results['files'][0]['id']
-        # print(f"✅ Pasta base encontrada: {base_folder_name} ({base_folder_id})")
-        
-        # Agora encontra a pasta do ano
-        bank_folder_id = None
-        results = service.files().list(
-            q=f"'{base_folder_id}' in parents and name='{bank_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            pageSize=1,
-            fields="files(id, name)"
-        ).execute()
-        
-        if not results.get('files'):
-            print(f"❌ Pasta do banco '{bank_name}' não encontrada")
-            return None
-        
-        bank_folder_id = results['files'][0]['id']
-        # print(f"✅ Pasta do banco encontrada: {bank_name} ({bank_folder_id})")    
-        
-        # Agora encontra a pasta do ano
-        year_folder_id = None
-        results = service.files().list(
-            q=f"'{bank_folder_id}' in parents and name='{year}' and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            pageSize=1,
-            fields="files(id, name)"
-        ).execute()
-        
-        if not results.get('files'):
-            print(f"❌ Pasta do ano '{year}' não encontrada")
-            return None
-        
-        year_folder_id = results['files'][0]['id']
-        # print(f"✅ Pasta do ano encontrada: {year} ({year_folder_id})")
-        
-        return year_folder_id 
+    @classmethod
+    def find_folder_id(self, credentials_path, base_folder_name, year, bank_name=None, month=None):
+        # Resolve Financeiro -> banco (-> ano -> mês); cada nível fica em cache (com TTL) entre execuções
+        levels = [('base', base_folder_name)]
+        if bank_name is not None:
+            levels.append(('do banco', bank_name))
+        if year is not None:
+            levels.append(('do ano', year))
+        if month is not None:
+            levels.append(('do mês', month))
+
+        service = None
+        parent_id = None
+        folder_path = ''
+        for label, name in levels:
+            folder_path = f"{folder_path}/{name}"
+            folder_id = session.get_cached_folder(folder_path)
+
+            if folder_id is None:
+                if service is None:
+                    service = self.get_drive_service(credentials_path)
+
+                query = f"name='{name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+                if parent_id is not None:
+                    query = f"'{parent_id}' in parents and {query}"
+                results = service.files().list(
+                    q=query,
+                    pageSize=1,
+                    fields="files(id, name)"
+                ).execute()
+
+                if not results.get('files'):
+                    print(f"❌ Pasta {label} '{name}' não encontrada")
+                    return None
+
+                folder_id = results['files'][0]['id']
+                session.set_cached_folder(folder_path, folder_id)
+                # print(f"✅ Pasta {label} encontrada: {name} ({folder_id})")
+
+            parent_id = folder_id
+
+        return parent_id
     
+    def build_sheet_payload(df):
+        # Texto de cada linha da planilha, gerado para a tabela inteira de uma vez
+        parcelamento = df['Parcela'].astype(str)
+        parcelamento = parcelamento.where(~parcelamento.str.startswith('-'), '')
+        descricao = df['Descrição'].astype(str) + ' ' + parcelamento
+
+        # Remove aspas indesejadas (se houver)
+        valor = df['Valor'].astype(str).str.replace(r"^['\"]", '', regex=True).str.replace(r"['\"]$", '', regex=True)
+
+        return {'descricao': descricao.tolist(), 'valor': valor.tolist()}
+
     @classmethod
-    def update_specific_cells_batch(self, df, sheet_name, worksheet_name, start_row, col_descricao, col_valor):
-        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials_path, scope)
-        client = gspread.authorize(creds)
-        sheet = client.open(sheet_name).worksheet(worksheet_name)
-        
-        # Pega todos os valores das colunas de descrição e valor
-        descricoes = sheet.col_values(col_descricao)
-        valores = sheet.col_values(col_valor)
-        
-        updates = []
-        for i in range(len(df)):
-            linha_planilha = start_row + i
-            parcelamento = str(df.iloc[i, 2])
-            if parcelamento.startswith('-'):
-                parcelamento =  ''
-            descricao = f"{str(df.iloc[i, 1])} {parcelamento}"
-            novo_valor = str(df.iloc[i, 3])
-
-            # Remove aspas indesejadas (se houver)
-            if novo_valor.startswith("'") or novo_valor.startswith('"'):
-                novo_valor = novo_valor[1:]
-            if novo_valor.endswith("'") or novo_valor.endswith('"'):
-                novo_valor = novo_valor[:-1]        
-            
-            # Verifica se a linha existe e se a descrição NÃO começa com "VR"
-            if len(descricoes) >= linha_planilha:
-                descricao_planilha = descricoes[linha_planilha - 1]
-                if len(descricao_planilha) > 0 and descricao_planilha != descricao:
-                    descricao = descricao_planilha
-                    
-            
-            # Adiciona à lista de atualizações
-            updates.append({
-                'range': f"{gspread.utils.rowcol_to_a1(linha_planilha, col_descricao)}:{gspread.utils.rowcol_to_a1(linha_planilha, col_valor)}",
-                'values': [[descricao, novo_valor]]
-            })
-        
-        # Executa todas as atualizações de uma vez
-        if updates:
-            sheet.batch_update(updates)
+    def update_specific_cells_batch(self, df, sheet_name, worksheet_name, start_row, col_descricao, col_valor, rows=None, clear_rows=None):
+        # rows: posições do df a escrever (None = todas); clear_rows: posições a esvaziar na planilha
+        return self.update_worksheets_batch(sheet_name, [{
+            'df': df,
+            'worksheet': worksheet_name,
+            'start_row': start_row,
+            'col_descricao': col_descricao,
+            'col_valor': col_valor,
+            'rows': rows,
+            'clear_rows': clear_rows
+        }])
+
+    @classmethod
+    def update_worksheets_batch(self, sheet_name, targets):
+        # Várias abas na mesma planilha: uma leitura e uma escrita (só das células alteradas).
+        # A planilha é uma projeção do ledger: blocos cujas células já foram todas escritas
+        # por aqui não são relidos (a menos que ledger.trust_projection seja False)
+        spreadsheet = session.open_spreadsheet(self.credentials_path, sheet_name)
+        writer_targets = []
+        for target in targets:
+            payload = self.build_sheet_payload(target['df'])
+            writer_target = {
+                'worksheet': target['worksheet'],
+                'start_row': target['start_row'],
+                'col_descricao': target['col_descricao'],
+                'col_valor': target['col_valor'],
+                'descricoes': payload['descricao'],
+                'valores': payload['valor'],
+                'rows': target.get('rows'),
+                'clear_rows': target.get('clear_rows')
+            }
+            if ledger.trust_projection and writer.get_block_size(writer_target) > 0:
+                writer_target['values'] = ledger.get_projection(sheet_name, *self.get_block_bounds(writer_target))
+            writer_targets.append(writer_target)
+
+        result = writer.write_many(spreadsheet, writer_targets)
+        for writer_target, values in result['blocks']:
+            first_row, _, first_col, _ = self.get_block_bounds(writer_target)[1:]
+            ledger.save_projection(sheet_name, writer_target['worksheet'], first_row, first_col, values)
+        return result
+
+    def get_block_bounds(target):
+        # (aba, primeira linha, última linha, primeira coluna, última coluna) do bloco na planilha
+        last_row = target['start_row'] + writer.get_block_size(target) - 1
+        first_col = min(target['col_descricao'], target['col_valor'])
+        last_col = max(target['col_descricao'], target['col_valor'])
+        return target['worksheet'], target['start_row'], last_row, first_col, last_col
@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from utils import Utils as utils
+
+class GoogleSession:
+
+    # Uma única credencial cobre Drive e Sheets
+    SCOPES = [
+        'https://spreadsheets.google.com/feeds',
+        'https://www.googleapis.com/auth/spreadsheets',
+        'https://www.googleapis.com/auth/drive'
+    ]
+
+    folder_ttl = int(os.environ.get('FINANCETRACK_FOLDER_TTL', str(24 * 60 * 60)))
+
+    lock = threading.RLock()
+    thread_local = threading.local()
+    credentials = {}
+    sheets_clients = {}
+    spreadsheets = {}
+    discovery_doc = None
+    folder_cache = None
+
+    @classmethod
+    def get_credentials(self, credentials_path):
+        # Autentica uma vez por processo; o oauth2client renova o token sozinho
+        with self.lock:
+            creds = self.credentials.get(credentials_path)
+            if creds is None:
+                # Bibliotecas do Google importadas só quando uma chamada à API é feita
+                from oauth2client.service_account import ServiceAccountCredentials
+                creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_path, self.SCOPES)
+                self.credentials[credentials_path] = creds
+            return creds
+
+    @classmethod
+    def get_discovery_doc(self):
+        # Documento de descoberta do Drive carregado uma vez e reaproveitado em todas as threads
+        with self.lock:
+            if self.discovery_doc is None:
+                try:
+                    from googleapiclient.discovery_cache import get_static_doc
+                    self.discovery_doc = get_static_doc('drive', 'v3')
+                except ImportError:
+                    self.discovery_doc = None
+            return self.discovery_doc
+
+    @classmethod
+    def get_drive_service(self, credentials_path):
+        # O cliente HTTP do googleapiclient não é thread-safe: um serviço (e conexão) por thread
+        services = getattr(self.thread_local, 'drive_services', None)
+        if services is None:
+            services = self.thread_local.drive_services = {}
+
+        service = services.get(credentials_path)
+        if service is None:
+            from googleapiclient.discovery import build, build_from_document
+            creds = self.get_credentials(credentials_path)
+            doc = self.get_discovery_doc()
+            if doc:
+                service = build_from_document(doc, credentials=creds)
+            else:
+                service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+            services[credentials_path] = service
+        return service
+
+    @classmethod
+    def get_sheets_client(self, credentials_path):
+        with self.lock:
+            client = self.sheets_clients.get(credentials_path)
+            if client is None:
+                import gspread
+                client = gspread.authorize(self.get_credentials(credentials_path))
+                self.sheets_clients[credentials_path] = client
+            return client
+
+    @classmethod
+    def open_spreadsheet(self, credentials_path, sheet_name):
+        # client.open faz uma busca no Drive a cada chamada; guarda a planilha já aberta
+        with self.lock:
+            spreadsheet = self.spreadsheets.get((credentials_path, sheet_name))
+            if spreadsheet is None:
+                spreadsheet = self.get_sheets_client(credentials_path).open(sheet_name)
+                self.spreadsheets[(credentials_path, sheet_name)] = spreadsheet
+            return spreadsheet
+
+    def get_folder_cache_path():
+        return os.path.join(utils.get_state_dir('cache'), 'folders.json')
+
+    @classmethod
+    def load_folder_cache(self):
+        if self.folder_cache is None:
+            try:
+                with open(self.get_folder_cache_path(), 'r', encoding='utf-8') as fh:
+                    self.folder_cache = json.load(fh)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.folder_cache = {}
+        return self.folder_cache
+
+    @classmethod
+    def get_cached_folder(self, folder_path):
+        with self.lock:
+            entry = self.load_folder_cache().get(folder_path)
+            if entry and entry['expires_at'] > time.time():
+                return entry['id']
+            return None
+
+    @classmethod
+    def set_cached_folder(self, folder_path, folder_id):
+        with self.lock:
+            cache = self.load_folder_cache()
+            cache[folder_path] = {'id': folder_id, 'expires_at': time.time() + self.folder_ttl}
+            path = self.get_folder_cache_path()
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump(cache, fh, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def clear_folder_cache(self):
+        with self.lock:
+            self.folder_cache = {}
+            try:
+                os.remove(self.get_folder_cache_path())
+            except FileNotFoundError:
+                pass
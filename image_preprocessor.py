@@ -0,0 +1,137 @@
+import argparse
+import os
+import time
+from bank_profiles import BankProfiles as profiles
+
+# Presets de pré-processamento: quanto mais agressivo, menor a imagem que chega ao EasyOCR
+PRESETS = {
+    'off': None,
+    'accurate': {'grayscale': True, 'max_width': None, 'crop_bands': False, 'autocrop': True},
+    'balanced': {'grayscale': True, 'max_width': 960, 'crop_bands': True, 'autocrop': True},
+    'fast': {'grayscale': True, 'max_width': 720, 'crop_bands': True, 'autocrop': True}
+}
+
+class ImagePreprocessor:
+
+    # Diferença mínima de tom para um pixel contar como conteúdo no auto-crop
+    autocrop_threshold = 25
+    autocrop_margin = 8
+
+    def get_config(preset, bank_name=None):
+        # Configuração concreta (entra na chave do cache de OCR)
+        if preset not in PRESETS:
+            raise ValueError(f"Preset de pré-processamento desconhecido: {preset}")
+        base = PRESETS[preset]
+        if base is None:
+            return None
+
+        config = dict(base, preset=preset, header_band=0.0, footer_band=0.0)
+        if base['crop_bands'] and bank_name is not None:
+            screenshot = profiles.get(bank_name).get('screenshot', {})
+            config['header_band'] = screenshot.get('header_band', 0.0)
+            config['footer_band'] = screenshot.get('footer_band', 0.0)
+        return config
+
+    def load(image):
+        import cv2
+        import numpy as np
+
+        if isinstance(image, str):
+            return cv2.imread(image)
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+        return image
+
+    @classmethod
+    def get_content_box(self, gray):
+        import numpy as np
+
+        # Fundo = mediana das bordas; descarta as faixas sem nenhum pixel diferente dele
+        border = np.concatenate([gray[0, :], gray[-1, :], gray[:, 0], gray[:, -1]])
+        mask = np.abs(gray.astype(np.int16) - np.median(border)) > self.autocrop_threshold
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if rows.size == 0 or cols.size == 0:
+            return None
+
+        margin = self.autocrop_margin
+        return (
+            max(0, rows[0] - margin), min(gray.shape[0], rows[-1] + margin + 1),
+            max(0, cols[0] - margin), min(gray.shape[1], cols[-1] + margin + 1)
+        )
+
+    @classmethod
+    def apply(self, image, config):
+        # Retorna um ndarray pronto para o readtext (ou a imagem original se config for None)
+        if config is None:
+            return image
+
+        import cv2
+
+        array = self.load(image)
+        if array is None:
+            return image
+
+        if config['grayscale'] and array.ndim == 3:
+            array = cv2.cvtColor(array, cv2.COLOR_BGR2GRAY)
+
+        # Remove barra de status/cabeçalho e barra de navegação fixas do app do banco
+        height = array.shape[0]
+        top = int(height * config['header_band'])
+        bottom = height - int(height * config['footer_band'])
+        if 0 < bottom - top < height:
+            array = array[top:bottom]
+
+        if config['autocrop']:
+            gray = array if array.ndim == 2 else cv2.cvtColor(array, cv2.COLOR_BGR2GRAY)
+            box = self.get_content_box(gray)
+            if box is not None:
+                top, bottom, left, right = box
+                array = array[top:bottom, left:right]
+
+        max_width = config['max_width']
+        if max_width and array.shape[1] > max_width:
+            scale = max_width / array.shape[1]
+            array = cv2.resize(array, (max_width, max(1, int(array.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+
+        return array
+
+    def compare(images, bank_name, preset):
+        # OCR com e sem pré-processamento; mostra tempo e diferença nas transações extraídas
+        from ocr_processor import OcrProcessor as ocr
+
+        results = {}
+        for name in ('off', preset):
+            started = time.perf_counter()
+            texts = ocr.extract_texts_from_images(images, bank_name=bank_name, preprocess=name, use_cache=False)
+            elapsed = time.perf_counter() - started
+            text = "".join(image_text + "\n" for image_text in texts)
+            results[name] = {'seconds': elapsed, 'transactions': ocr.extract_transactions_from_text(text, bank_name)}
+
+        baseline = results['off']['transactions']
+        candidate = results[preset]['transactions']
+        return {
+            'baseline_seconds': round(results['off']['seconds'], 3),
+            'preset_seconds': round(results[preset]['seconds'], 3),
+            'baseline_count': len(baseline),
+            'preset_count': len(candidate),
+            'missing': [transaction for transaction in baseline if transaction not in candidate],
+            'extra': [transaction for transaction in candidate if transaction not in baseline]
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara o OCR com e sem pré-processamento das imagens")
+    parser.add_argument('images', nargs='+', help="Prints de tela a comparar (na ordem da fatura)")
+    parser.add_argument('--bank', default="c6")
+    parser.add_argument('--preset', default="balanced", choices=[name for name in PRESETS if name != 'off'])
+    args = parser.parse_args()
+
+    images = sorted(args.images, key=os.path.basename)
+    report = ImagePreprocessor.compare(images, args.bank, args.preset)
+    print(f"sem pré-processamento: {report['baseline_seconds']}s, {report['baseline_count']} transações")
+    print(f"preset {args.preset}: {report['preset_seconds']}s, {report['preset_count']} transações")
+    for transaction in report['missing']:
+        print(f"  - faltando: {transaction}")
+    for transaction in report['extra']:
+        print(f"  + a mais:   {transaction}")
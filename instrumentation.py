@@ -0,0 +1,185 @@
+import argparse
+import contextvars
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from utils import Utils as utils
+
+# Trace do job em execução; asyncio.to_thread copia o contexto para a thread do job
+current_trace = contextvars.ContextVar('financetrack_trace', default=None)
+
+class Trace:
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.started_at = time.time()
+        self.seconds = None
+        self.spans = []
+        self.counters = {}
+        self.flags = []
+        self.marks = {}
+        self.lock = threading.Lock()
+
+    def add_span(self, stage, started, seconds, fields):
+        with self.lock:
+            self.spans.append(dict(fields, stage=stage, start=round(started - self.started_at, 6), seconds=round(seconds, 6)))
+
+    def add(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def flag(self, kind, fields):
+        with self.lock:
+            self.flags.append(dict(fields, kind=kind))
+
+    def mark(self, name, offset):
+        # Só a primeira ocorrência conta (ex.: tempo até a primeira transação)
+        with self.lock:
+            self.marks.setdefault(name, round(offset, 6))
+
+    def get_stages(self):
+        # Totais por estágio: quantas vezes rodou, tempo somado e a chamada mais lenta
+        stages = {}
+        for span in self.spans:
+            stage = stages.setdefault(span['stage'], {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] = round(stage['seconds'] + span['seconds'], 6)
+            stage['max_seconds'] = max(stage['max_seconds'], span['seconds'])
+            for field in ('bytes', 'images', 'items'):
+                if field in span:
+                    stage[field] = stage.get(field, 0) + span[field]
+        return stages
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'attributes': self.attributes,
+            'started_at': self.started_at,
+            'seconds': self.seconds,
+            'stages': self.get_stages(),
+            'counters': self.counters,
+            'marks': self.marks,
+            'flags': self.flags,
+            'spans': self.spans
+        }
+
+class Instrumentation:
+
+    # Diretório dos traces em JSON (padrão: .financetrack/traces)
+    trace_dir = os.environ.get('FINANCETRACK_TRACE_DIR')
+    # Grava também um .prof do cProfile ao lado de cada trace
+    profile = os.environ.get('FINANCETRACK_PROFILE', '0') == '1'
+    # Só um cProfile pode estar ativo por processo (ValueError no Python 3.12+): com o perfil
+    # ligado, os jobs simultâneos rodam um de cada vez
+    profile_lock = threading.Lock()
+
+    def get_trace_dir():
+        if Instrumentation.trace_dir:
+            os.makedirs(Instrumentation.trace_dir, exist_ok=True)
+            return Instrumentation.trace_dir
+        return utils.get_state_dir('traces')
+
+    def get_trace():
+        return current_trace.get()
+
+    @classmethod
+    def run(self, name, func, *args, attributes=None, **kwargs):
+        # Executa func com um trace ativo e grava o JSON (e o perfil) ao final, mesmo com erro
+        trace = Trace(name, attributes)
+        token = current_trace.set(trace)
+        # O cProfile só enxerga a thread em que foi ativado (a do job)
+        profiler = cProfile.Profile() if self.profile else None
+        if profiler:
+            self.profile_lock.acquire()
+        started = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            return func(*args, **kwargs)
+        except Exception as error:
+            trace.attributes['error'] = str(error)
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+                self.profile_lock.release()
+            trace.seconds = round(time.perf_counter() - started, 6)
+            current_trace.reset(token)
+            self.write(trace, profiler)
+
+    @classmethod
+    def write(self, trace, profiler=None):
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(trace.started_at))
+        base_path = os.path.join(self.get_trace_dir(), f"{trace.name}_{stamp}")
+        tmp_path = f"{base_path}.json.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(trace.to_dict(), fh, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, f"{base_path}.json")
+        if profiler:
+            profiler.dump_stats(f"{base_path}.prof")
+        return f"{base_path}.json"
+
+    @classmethod
+    @contextmanager
+    def stage(self, name, **fields):
+        # Mede o bloco; quem chama pode completar os campos (bytes, images...) pelo dict retornado
+        trace = self.get_trace()
+        started = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            if trace is not None:
+                trace.add_span(name, started, time.perf_counter() - started, fields)
+
+    @classmethod
+    def count(self, counter, value=1):
+        trace = self.get_trace()
+        if trace is not None:
+            trace.add(counter, value)
+
+    @classmethod
+    def flag(self, kind, **fields):
+        trace = self.get_trace()
+        if trace is not None:
+            trace.flag(kind, fields)
+
+    @classmethod
+    def mark(self, name):
+        trace = self.get_trace()
+        if trace is not None:
+            trace.mark(name, time.time() - trace.started_at)
+
+    @classmethod
+    def summarize(self, path):
+        with open(path, 'r', encoding='utf-8') as fh:
+            trace = json.load(fh)
+        lines = [f"{trace['name']}: {trace['seconds']}s"]
+        for name, stage in sorted(trace['stages'].items(), key=lambda pair: -pair[1]['seconds']):
+            extra = "".join(f" {field}={stage[field]}" for field in ('images', 'items', 'bytes') if field in stage)
+            lines.append(f"  {name:<16} {stage['calls']:>5}x {stage['seconds']:>10.3f}s (máx {stage['max_seconds']:.3f}s){extra}")
+        for counter, value in sorted(trace['counters'].items()):
+            lines.append(f"  {counter}: {value}")
+        for name, offset in trace.get('marks', {}).items():
+            lines.append(f"  {name}: {offset:.3f}s após o início")
+        for flag in trace['flags']:
+            if flag['kind'] == 'low_confidence':
+                lines.append(f"  ⚠️  confiança {flag['confidence']:.2f}: {flag['transaction']} ({flag['file']})")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resume os traces gravados pelas execuções")
+    parser.add_argument('traces', nargs='*', help="Arquivos de trace (padrão: o mais recente)")
+    args = parser.parse_args()
+
+    paths = args.traces
+    if not paths:
+        trace_dir = Instrumentation.get_trace_dir()
+        candidates = [os.path.join(trace_dir, name) for name in os.listdir(trace_dir) if name.endswith('.json')]
+        paths = sorted(candidates, key=os.path.getmtime)[-1:]
+    for path in paths:
+        print(Instrumentation.summarize(path))
@@ -0,0 +1,340 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from utils import Utils as utils
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bank TEXT NOT NULL,
+    year TEXT NOT NULL,
+    month TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    added INTEGER NOT NULL DEFAULT 0,
+    removed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_runs_statement ON runs (bank, year, month, id);
+
+-- Uma linha por transação de cada fatura; removed_run marca as que saíram numa execução posterior
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bank TEXT NOT NULL,
+    year TEXT NOT NULL,
+    month TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    file_id TEXT,
+    data TEXT,
+    descricao TEXT,
+    parcela TEXT,
+    valor TEXT,
+    data_lancamento TEXT,
+    valor_centavos INTEGER,
+    parcela_atual INTEGER,
+    parcela_total INTEGER,
+    sheet_name TEXT,
+    worksheet TEXT,
+    sheet_row INTEGER,
+    col_descricao INTEGER,
+    col_valor INTEGER,
+    added_run INTEGER NOT NULL,
+    removed_run INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_key ON transactions (bank, year, month, fingerprint, occurrence)
+    WHERE removed_run IS NULL;
+CREATE INDEX IF NOT EXISTS idx_transactions_statement ON transactions (bank, year, month, position);
+CREATE INDEX IF NOT EXISTS idx_transactions_fingerprint ON transactions (fingerprint);
+CREATE INDEX IF NOT EXISTS idx_transactions_file ON transactions (file_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (data_lancamento);
+
+-- Projeção da planilha: o último valor escrito (ou lido) em cada célula gerenciada
+CREATE TABLE IF NOT EXISTS sheet_cells (
+    sheet_name TEXT NOT NULL,
+    worksheet TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    col INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (sheet_name, worksheet, row, col)
+) WITHOUT ROWID;
+"""
+
+class Ledger:
+
+    # Banco SQLite local com todas as transações importadas (padrão: .financetrack/ledger/ledger.sqlite3)
+    path = os.environ.get('FINANCETRACK_LEDGER')
+    # Com a projeção confiável, células já escritas não são relidas da planilha antes de escrever;
+    # FINANCETRACK_SHEET_VERIFY=1 volta a ler a planilha a cada execução
+    trust_projection = os.environ.get('FINANCETRACK_SHEET_VERIFY', '0') != '1'
+
+    # Uma conexão por processo, compartilhada pelos jobs (threads) sob o lock
+    lock = threading.RLock()
+    connection = None
+
+    def get_path():
+        return Ledger.path or os.path.join(utils.get_state_dir('ledger'), 'ledger.sqlite3')
+
+    @classmethod
+    def connect(self):
+        with self.lock:
+            if self.connection is None:
+                connection = sqlite3.connect(self.get_path(), check_same_thread=False)
+                connection.row_factory = sqlite3.Row
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+                connection.executescript(SCHEMA)
+                self.connection = connection
+            return self.connection
+
+    @classmethod
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def get_fingerprints(df, bank):
+        # Identidade da transação: banco, data, descrição normalizada, valor e parcela
+        descricao = df['Descrição'].astype(str).str.upper().str.split().str.join(' ')
+        data = df['data_lancamento'].dt.strftime('%Y-%m-%d').fillna(df['Data'].astype(str))
+        valor = df['valor_centavos'].astype(str)
+        keys = bank + '|' + data + '|' + descricao + '|' + valor + '|' + df['Parcela'].astype(str)
+        return keys.map(lambda key: hashlib.sha1(key.encode('utf-8')).hexdigest()[:20])
+
+    def get_values(series):
+        # Lista com None no lugar de NaN/NA/NaT (o que o sqlite3 aceita)
+        return series.astype(object).where(series.notna(), None).tolist()
+
+    @classmethod
+    def build_records(self, df, bank, sources=None):
+        # Linhas prontas para o SQLite; occurrence separa transações idênticas na mesma fatura
+        fingerprints = self.get_fingerprints(df, bank)
+        columns = {
+            'fingerprint': fingerprints.tolist(),
+            'occurrence': fingerprints.groupby(fingerprints).cumcount().tolist(),
+            'position': list(range(len(df))),
+            'file_id': list(sources) if sources is not None else [None] * len(df),
+            'data': self.get_values(df['Data']),
+            'descricao': self.get_values(df['Descrição']),
+            'parcela': self.get_values(df['Parcela']),
+            'valor': self.get_values(df['Valor']),
+            'data_lancamento': self.get_values(df['data_lancamento'].dt.strftime('%Y-%m-%d')),
+            'valor_centavos': self.get_values(df['valor_centavos']),
+            'parcela_atual': self.get_values(df['parcela_atual']),
+            'parcela_total': self.get_values(df['parcela_total'])
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    @classmethod
+    def record_statement(self, bank, year, month, df, sources=None, sheet=None):
+        # Grava a fatura atual e marca como removidas as transações que sumiram.
+        # sheet: {'sheet_name', 'worksheet', 'start_row', 'col_descricao', 'col_valor'}
+        year = str(year)
+        records = self.build_records(df, bank, sources)
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                run_id = connection.execute(
+                    "INSERT INTO runs (bank, year, month, created_at) VALUES (?, ?, ?, ?)",
+                    (bank, year, month, now)
+                ).lastrowid
+                existing = {
+                    (row['fingerprint'], row['occurrence']): row['id']
+                    for row in connection.execute(
+                        "SELECT id, fingerprint, occurrence FROM transactions "
+                        "WHERE bank = ? AND year = ? AND month = ? AND removed_run IS NULL",
+                        (bank, year, month)
+                    )
+                }
+
+                added = 0
+                for record in records:
+                    target = {'sheet_name': None, 'worksheet': None, 'sheet_row': None, 'col_descricao': None, 'col_valor': None}
+                    if sheet is not None:
+                        target = {
+                            'sheet_name': sheet['sheet_name'],
+                            'worksheet': sheet['worksheet'],
+                            'sheet_row': sheet['start_row'] + record['position'],
+                            'col_descricao': sheet['col_descricao'],
+                            'col_valor': sheet['col_valor']
+                        }
+                    values = dict(record, **target, updated_at=now)
+                    transaction_id = existing.pop((record['fingerprint'], record['occurrence']), None)
+                    if transaction_id is None:
+                        added += 1
+                        values.update(bank=bank, year=year, month=month, added_run=run_id)
+                        names = ", ".join(values)
+                        connection.execute(
+                            f"INSERT INTO transactions ({names}) VALUES ({', '.join('?' for _ in values)})",
+                            list(values.values())
+                        )
+                    else:
+                        assignments = ", ".join(f"{name} = ?" for name in values)
+                        connection.execute(
+                            f"UPDATE transactions SET {assignments} WHERE id = ?",
+                            list(values.values()) + [transaction_id]
+                        )
+
+                # O que sobrou em existing não está mais na fatura
+                connection.executemany(
+                    "UPDATE transactions SET removed_run = ?, updated_at = ? WHERE id = ?",
+                    [(run_id, now, transaction_id) for transaction_id in existing.values()]
+                )
+                connection.execute(
+                    "UPDATE runs SET added = ?, removed = ? WHERE id = ?",
+                    (added, len(existing), run_id)
+                )
+        return {'run': run_id, 'added': added, 'removed': len(existing), 'total': len(records)}
+
+    @classmethod
+    def get_statement(self, bank, year, month):
+        with self.lock:
+            return [dict(row) for row in self.connect().execute(
+                "SELECT * FROM transactions WHERE bank = ? AND year = ? AND month = ? AND removed_run IS NULL "
+                "ORDER BY position",
+                (bank, str(year), month)
+            )]
+
+    @classmethod
+    def get_changes(self, bank, year, month, run_id=None):
+        # O que entrou e saiu da fatura na execução informada (padrão: a última)
+        with self.lock:
+            connection = self.connect()
+            if run_id is None:
+                row = connection.execute(
+                    "SELECT MAX(id) AS id FROM runs WHERE bank = ? AND year = ? AND month = ?",
+                    (bank, str(year), month)
+                ).fetchone()
+                run_id = row['id']
+            if run_id is None:
+                return {'run': None, 'added': [], 'removed': []}
+            added = connection.execute(
+                "SELECT * FROM transactions WHERE added_run = ? ORDER BY position", (run_id,)
+            ).fetchall()
+            removed = connection.execute(
+                "SELECT * FROM transactions WHERE removed_run = ? ORDER BY position", (run_id,)
+            ).fetchall()
+            return {'run': run_id, 'added': [dict(row) for row in added], 'removed': [dict(row) for row in removed]}
+
+    @classmethod
+    def search(self, text=None, bank=None, date_from=None, date_to=None):
+        # Consulta entre meses: descrição, banco e intervalo de datas de lançamento (AAAA-MM-DD)
+        clauses, params = ["removed_run IS NULL"], []
+        if text:
+            clauses.append("descricao LIKE ?")
+            params.append(f"%{text}%")
+        if bank:
+            clauses.append("bank = ?")
+            params.append(bank)
+        if date_from:
+            clauses.append("data_lancamento >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("data_lancamento <= ?")
+            params.append(date_to)
+        with self.lock:
+            return [dict(row) for row in self.connect().execute(
+                f"SELECT * FROM transactions WHERE {' AND '.join(clauses)} ORDER BY data_lancamento, bank, position",
+                params
+            )]
+
+    @classmethod
+    def get_projection(self, sheet_name, worksheet, first_row, last_row, first_col, last_col):
+        # Valores do bloco como a planilha deveria estar, ou None se alguma célula nunca foi registrada
+        with self.lock:
+            rows = self.connect().execute(
+                "SELECT row, col, value FROM sheet_cells WHERE sheet_name = ? AND worksheet = ? "
+                "AND row BETWEEN ? AND ? AND col BETWEEN ? AND ?",
+                (sheet_name, worksheet, first_row, last_row, first_col, last_col)
+            ).fetchall()
+        if len(rows) != (last_row - first_row + 1) * (last_col - first_col + 1):
+            return None
+        values = [[''] * (last_col - first_col + 1) for _ in range(last_row - first_row + 1)]
+        for row in rows:
+            values[row['row'] - first_row][row['col'] - first_col] = row['value']
+        return values
+
+    @classmethod
+    def save_projection(self, sheet_name, worksheet, first_row, first_col, values):
+        now = time.time()
+        cells = [
+            (sheet_name, worksheet, first_row + i, first_col + j, value, now)
+            for i, row_values in enumerate(values)
+            for j, value in enumerate(row_values)
+        ]
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.executemany(
+                    "INSERT INTO sheet_cells (sheet_name, worksheet, row, col, value, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (sheet_name, worksheet, row, col) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                    cells
+                )
+
+    @classmethod
+    def clear_projection(self, sheet_name=None, worksheet=None):
+        # Esquece o que foi escrito: a próxima execução volta a ler a planilha
+        clauses, params = [], []
+        if sheet_name:
+            clauses.append("sheet_name = ?")
+            params.append(sheet_name)
+        if worksheet:
+            clauses.append("worksheet = ?")
+            params.append(worksheet)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                return connection.execute(f"DELETE FROM sheet_cells{where}", params).rowcount
+
+
+def print_transactions(transactions):
+    for transaction in transactions:
+        print(
+            f"{transaction['bank']:<4} {transaction['year']}/{transaction['month']:<4} "
+            f"{transaction['data'] or '':<11} {transaction['descricao'] or '':<45} {transaction['valor'] or '':>12}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consulta o ledger local de transações")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    statement_parser = subparsers.add_parser('fatura', help="Transações de uma fatura")
+    changes_parser = subparsers.add_parser('mudancas', help="O que entrou/saiu na última execução de uma fatura")
+    for subparser in (statement_parser, changes_parser):
+        subparser.add_argument('bank')
+        subparser.add_argument('year')
+        subparser.add_argument('month')
+
+    search_parser = subparsers.add_parser('buscar', help="Busca entre meses")
+    search_parser.add_argument('text', nargs='?')
+    search_parser.add_argument('--bank')
+    search_parser.add_argument('--from', dest='date_from', help="Data inicial (AAAA-MM-DD)")
+    search_parser.add_argument('--to', dest='date_to', help="Data final (AAAA-MM-DD)")
+
+    clear_parser = subparsers.add_parser('limpar-projecao', help="Força a releitura da planilha na próxima execução")
+    clear_parser.add_argument('--sheet')
+    clear_parser.add_argument('--worksheet')
+    args = parser.parse_args()
+
+    if args.command == 'fatura':
+        print_transactions(Ledger.get_statement(args.bank, args.year, args.month))
+    elif args.command == 'mudancas':
+        changes = Ledger.get_changes(args.bank, args.year, args.month)
+        print(f"execução {changes['run']}: {len(changes['added'])} novas, {len(changes['removed'])} removidas")
+        for label, transactions in (('+', changes['added']), ('-', changes['removed'])):
+            for transaction in transactions:
+                print(f"{label} {transaction['data']} {transaction['descricao']} {transaction['valor']}")
+    elif args.command == 'buscar':
+        transactions = Ledger.search(args.text, args.bank, args.date_from, args.date_to)
+        print_transactions(transactions)
+        total = sum(transaction['valor_centavos'] or 0 for transaction in transactions)
+        print(f"{len(transactions)} transações, total R$ {total / 100:.2f}")
+    elif args.command == 'limpar-projecao':
+        print(f"{Ledger.clear_projection(args.sheet, args.worksheet)} células esquecidas")
@@ -1,50 +1,265 @@
-import os
+import argparse
+import asyncio
+import heapq
+import sys
+import tempfile
+import time
+from drive_statements import DriveStatements as statements
 from ocr_processor import OcrProcessor as ocr
 from google_manager import GoogleManager as gdrive
+from google_session import GoogleSession as session
+from instrumentation import Instrumentation as instrumentation
+from ledger import Ledger as ledger
+from screenshot_stitcher import ScreenshotStitcher as stitcher
+from sync_manifest import SyncManifest as manifests
 from utils import Utils as utils
 
-def run_expenses(bank):
+def iter_statement_files(bank, manifest, changed, removed, in_memory=True, local_dir=None):
+    # Todos os prints da fatura na ordem final (nome do arquivo): os já conhecidos vêm do
+    # manifesto e os novos/alterados saem do OCR à medida que ficam prontos.
+    # Gera (id do arquivo, item, detecções, texto); item e detecções são None para os arquivos do manifesto.
+    skip = set(removed) | {item['id'] for item in changed}
+    known = (
+        (entry['name'], file_id, None, None, entry['text'])
+        for file_id, entry in manifests.get_ordered_files(manifest) if file_id not in skip
+    )
+    fresh = (
+        (item['name'], item['id'], item, image_detections, text)
+        for item, image_detections, text in statements.iter_file_texts(bank, changed, in_memory, local_dir)
+    )
+    for _, file_id, item, image_detections, text in heapq.merge(known, fresh, key=lambda entry: entry[0]):
+        yield file_id, item, image_detections, text
+
+def resolve_folder(bank, year, month, allow_year_folder=True):
+    # Prints de cada fatura ficam em Financeiro/<banco>/<ano>/<mês>; sem a
+    # subpasta do mês, usa a pasta do ano (comportamento original)
+    if month is not None:
+        folder_id = gdrive.get_folder_id_from_bank_name(year, bank, month)
+        if folder_id is not None or not allow_year_folder:
+            return folder_id
+        print(f"{bank}: usando a pasta do ano {year} para o mês {month}")
+    return gdrive.get_folder_id_from_bank_name(year, bank)
+
+def run_expenses(bank, month=None, year=None, in_memory=True, full=False, workspace=None, allow_year_folder=True):
     start_row, col_descricao, col_valor = utils.get_first_line(bank)
+    sheet_name = utils.get_sheet_name(bank)
+    year = year or utils.get_current_year()
+    month = month or utils.get_current_sheet_month()
+    summary = {'bank': bank, 'month': month, 'year': str(year), 'images': 0, 'transactions': 0, 'rows_written': 0}
 
-    if not os.path.exists(f"./{bank}"):
-        os.makedirs(f"./{bank}")
+    with instrumentation.stage('folder_lookup'):
+        folder_id = resolve_folder(bank, year, month, allow_year_folder)
+    if folder_id is None:
+        raise RuntimeError(f"Pasta de {bank} {month}/{year} não encontrada no Drive")
+    manifest = manifests.load(bank, year, month)
 
-    for arquivo in os.listdir(f"./{bank}"):
-        caminho_arquivo = os.path.join(f"./{bank}", arquivo)
-        if os.path.isfile(caminho_arquivo):
-            os.remove(caminho_arquivo)    
+    if full or not manifest['page_token'] or manifest['folder_id'] != folder_id:
+        # O token é obtido antes da listagem para não perder alterações feitas durante a execução
+        with instrumentation.stage('list_files') as span:
+            page_token = gdrive.get_changes_start_token(gdrive.credentials_path)
+            files = gdrive.list_statement_files_from_drive(folder_id, gdrive.credentials_path)
+            span['items'] = len(files)
+        changed, removed = manifests.plan_full(manifest, files)
+    else:
+        with instrumentation.stage('list_changes') as span:
+            changes, page_token = gdrive.list_changes_from_drive(manifest['page_token'], gdrive.credentials_path)
+            span['items'] = len(changes)
+        changed, removed = manifests.plan_changes(manifest, folder_id, changes)
 
-    # Baixa múltiplas imagens e recebe uma lista de nomes de arquivos
-    image_files = gdrive.download_images_from_drive(
-        credentials_path=gdrive.credentials_path,
-        folder_id=gdrive.get_folder_id_from_bank_name(utils.get_current_year(), bank),
-        local_dir=f"./{bank}"
-    )
+    summary['images'] = len(changed)
+    if not changed and not removed and manifest['folder_id'] == folder_id:
+        print(f"{bank} {month}: nenhuma imagem nova ou alterada")
+        manifest['page_token'] = page_token
+        manifests.save(manifest)
+        summary['transactions'] = len(manifest['rows'])
+        return summary
+
+    changed.sort(key=lambda item: item['name'])
+    processed = []
+    # Arquivo de origem de cada print, na ordem em que entram no parser
+    file_ids = []
+
+    def iter_statement_texts():
+        for file_id, item, image_detections, text in iter_statement_files(bank, manifest, changed, removed, in_memory, workspace):
+            file_ids.append(file_id)
+            if item is not None:
+                processed.append((item, image_detections, text))
+            yield text
+
+    # Download, OCR e parse encadeados: uma transação é emitida quando a linha de data da
+    # seguinte aparece, mesmo que comece em um print e termine no próximo; o que um print
+    # repete do anterior na emenda é descartado
+    transacoes_limpas = []
+    sources = []
+    for tag, transaction in ocr.iter_transactions_from_screenshots(iter_statement_texts(), bank, with_tags=True):
+        if not transacoes_limpas:
+            instrumentation.mark('first_transaction')
+        transacoes_limpas.append(transaction)
+        sources.append(file_ids[tag])
+
+    with instrumentation.stage('parse') as span:
+        df = ocr.parse_credit_card_statement(transacoes_limpas, bank, year, sources=sources)
+        span['items'] = len(df)
+
+    # Transações de cada arquivo, guardadas no manifesto para consulta
+    items = [item for item, _, _ in processed]
+    texts = [text for _, _, text in processed]
+    transactions = {
+        item['id']: ocr.extract_transactions_from_text(text + "\n", bank)
+        for item, text in zip(items, texts)
+    }
+    manifests.apply(manifest, items, texts, removed, transactions)
 
-    # Garante que image_files é uma lista
-    if isinstance(image_files, str):
-        image_files = [image_files]
+    # Confiança do OCR por imagem; transações com trechos duvidosos vão para o trace e o resumo
+    low_confidence = []
+    for item, image_detections, _ in processed:
+        stats = ocr.get_confidence_stats(image_detections)
+        if stats['detections']:
+            instrumentation.flag('ocr_confidence', file=item['name'], **stats)
+        for flagged in ocr.get_low_confidence_transactions(transactions[item['id']], image_detections, bank):
+            instrumentation.flag('low_confidence', file=item['name'], **flagged)
+            low_confidence.append(flagged)
+            print(f"⚠️  {bank} {month}: confiança {flagged['confidence']:.2f} em '{flagged['transaction']}' ({item['name']})")
 
-    image_files.sort()
+    # Ledger local: cada transação com o arquivo de origem e a célula de destino na planilha
+    with instrumentation.stage('ledger') as span:
+        recorded = ledger.record_statement(bank, year, month, df, sources=df['source'].tolist(), sheet={
+            'sheet_name': sheet_name,
+            'worksheet': month,
+            'start_row': start_row,
+            'col_descricao': col_descricao,
+            'col_valor': col_valor
+        })
+        span['items'] = recorded['total']
 
-    # Extrai e concatena texto de todas as imagens
-    text = ""
-    for file_name in image_files:
-        # print(f"File name: {file_name}")
-        full_path = f"{bank}/{file_name}"
-        text += ocr.extract_text_from_image(full_path) + "\n"
+    rows = df[['Data', 'Descrição', 'Parcela', 'Valor']].astype(str).values.tolist()
+    changed_rows, cleared_rows = manifests.diff_rows(manifest['rows'], rows)
+    if full:
+        # Reescreve todas as linhas, mas as que sobraram da execução anterior ainda são limpas
+        changed_rows = list(range(len(rows)))
+    if changed_rows or cleared_rows:
+        with instrumentation.stage('sheet_write') as span:
+            result = gdrive.update_specific_cells_batch(
+                df, sheet_name, month, start_row, col_descricao, col_valor,
+                rows=changed_rows, clear_rows=cleared_rows
+            )
+            span['items'] = result['cells']
 
-    for arquivo in os.listdir(f"./{bank}"):
-        caminho_arquivo = os.path.join(f"./{bank}", arquivo)
-        if os.path.isfile(caminho_arquivo):
-            os.remove(caminho_arquivo)
+    manifest['folder_id'] = folder_id
+    manifest['page_token'] = page_token
+    manifest['rows'] = rows
+    manifests.save(manifest)
 
-    transacoes_limpas = ocr.extract_transactions_from_text(text, bank)
-    df = ocr.parse_credit_card_statement(transacoes_limpas)
-    gdrive.update_specific_cells_batch(df, "Financeiro", "Fev", start_row, col_descricao, col_valor)
+    summary['transactions'] = len(rows)
+    summary['rows_written'] = len(changed_rows) + len(cleared_rows)
+    summary['cells_written'] = result['cells'] if changed_rows or cleared_rows else 0
+    summary['low_confidence'] = len(low_confidence)
+    summary['new_transactions'] = recorded['added']
+    summary['removed_transactions'] = recorded['removed']
+    return summary
+
+async def run_job(semaphore, bank, month, year, args):
+    async with semaphore:
+        started = time.perf_counter()
+        # Cada job tem o seu diretório temporário, mesmo com vários bancos/meses em paralelo
+        with tempfile.TemporaryDirectory(prefix=f"{bank}_{month}_") as workspace:
+            try:
+                # Drive/Sheets rodam em threads; o OCR vai para o pool compartilhado do OcrProcessor
+                # Cada job grava o seu trace em .financetrack/traces (python instrumentation.py resume o último)
+                summary = await asyncio.to_thread(
+                    instrumentation.run, f"{bank}_{year}_{month}", run_expenses, bank, month, year,
+                    in_memory=not args.on_disk,
+                    full=args.full,
+                    workspace=workspace,
+                    allow_year_folder=args.allow_year_folder
+                )
+                summary['status'] = 'ok'
+            except Exception as error:
+                summary = {'bank': bank, 'month': month, 'year': str(year), 'status': f"erro: {error}"}
+        summary['seconds'] = round(time.perf_counter() - started, 2)
+        return summary
+
+async def run_pipeline(banks, months, year, args):
+    return await run_jobs([(bank, month, year) for bank in banks for month in months], args)
+
+async def run_jobs(jobs, args):
+    # jobs: [(banco, mês, ano)], no máximo args.jobs ao mesmo tempo
+    semaphore = asyncio.Semaphore(args.jobs)
+    return await asyncio.gather(*[run_job(semaphore, bank, month, year, args) for bank, month, year in jobs])
+
+def print_summary(summaries):
+    print(f"{'banco':<6} {'mês':<4} {'ano':<5} {'imagens':>7} {'transações':>10} {'novas':>5} {'saíram':>6} {'linhas':>6} {'células':>7} {'conferir':>8} {'tempo':>7}  status")
+    for summary in summaries:
+        print(
+            f"{summary['bank']:<6} {summary['month']:<4} {summary['year']:<5} "
+            f"{summary.get('images', 0):>7} {summary.get('transactions', 0):>10} "
+            f"{summary.get('new_transactions', 0):>5} {summary.get('removed_transactions', 0):>6} "
+            f"{summary.get('rows_written', 0):>6} {summary.get('cells_written', 0):>7} {summary.get('low_confidence', 0):>8} "
+            f"{summary['seconds']:>6}s  {summary['status']}"
+        )
 
 
 
 if __name__ == "__main__":
-    # run_expenses("xp")
-    run_expenses("c6")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Importa as despesas do cartão para a planilha")
+    parser.add_argument('--banks', default="c6", help="Bancos separados por vírgula (ex: c6,xp)")
+    parser.add_argument('--months', default=None, help="Abas/meses: 'Fev', 'Jan,Mar' ou 'Jan..Dez' (padrão: mês atual)")
+    parser.add_argument('--year', default=None, help="Ano da pasta no Drive (padrão: ano atual)")
+    parser.add_argument('--jobs', type=int, default=4, help="Quantidade de jobs banco/mês simultâneos")
+    parser.add_argument('--ocr-workers', type=int, default=None, help="Processos do pool de OCR compartilhado")
+    parser.add_argument('--ocr-mode', default=None, choices=['default', 'fast_cpu'], help="Modo de inferência do EasyOCR (fast_cpu: mais rápido, um pouco menos preciso)")
+    parser.add_argument('--ocr-threads', type=int, default=None, help="Threads do torch para o OCR")
+    parser.add_argument('--ocr-canvas-size', type=int, default=None, help="Maior lado da imagem no detector do EasyOCR")
+    parser.add_argument('--ocr-batch-size', type=int, default=None, help="Recortes por lote no reconhecedor do EasyOCR")
+    parser.add_argument('--ocr-paragraph', action=argparse.BooleanOptionalAction, default=None, help="Junta as caixas próximas em parágrafos")
+    parser.add_argument('--ocr-allowlist', default=None, help="Caracteres aceitos pelo reconhecedor ('digits': só valores e datas)")
+    parser.add_argument('--ocr-quantize', action=argparse.BooleanOptionalAction, default=None, help="Quantização dinâmica do modelo na CPU")
+    parser.add_argument('--preprocess', default=None, choices=['off', 'accurate', 'balanced', 'fast'], help="Pré-processamento das imagens antes do OCR")
+    parser.add_argument('--stitch', action='store_true', help="Detecta a sobreposição entre prints consecutivos e só faz OCR da parte nova")
+    parser.add_argument('--no-dedup', action='store_true', help="Não descarta transações repetidas na emenda entre prints")
+    parser.add_argument('--on-disk', action='store_true', help="Baixa as imagens para disco em vez de mantê-las em memória")
+    parser.add_argument('--full', action='store_true', help="Ignora o manifesto local e reprocessa a pasta inteira")
+    parser.add_argument('--profile', action='store_true', help="Grava um perfil do cProfile (.prof) junto com o trace de cada job (os jobs passam a rodar um por vez)")
+    parser.add_argument('--trace-dir', default=None, help="Diretório dos traces em JSON (padrão: .financetrack/traces)")
+    parser.add_argument('--refresh-folders', action='store_true', help="Descarta os IDs de pasta guardados em cache")
+    parser.add_argument('--verify-sheet', action='store_true', help="Relê a planilha antes de escrever em vez de confiar na projeção do ledger")
+    args = parser.parse_args()
+
+    if args.refresh_folders:
+        session.clear_folder_cache()
+    if args.verify_sheet:
+        ledger.trust_projection = False
+    if args.stitch:
+        stitcher.enabled = True
+    if args.no_dedup:
+        ocr.dedup = False
+    if args.profile:
+        instrumentation.profile = True
+    if args.trace_dir is not None:
+        instrumentation.trace_dir = args.trace_dir
+    if args.ocr_workers is not None:
+        ocr.workers = args.ocr_workers
+    if args.preprocess is not None:
+        ocr.preprocess = args.preprocess
+    ocr_overrides = {
+        'mode': args.ocr_mode, 'threads': args.ocr_threads, 'canvas_size': args.ocr_canvas_size,
+        'batch_size': args.ocr_batch_size, 'paragraph': args.ocr_paragraph,
+        'allowlist': args.ocr_allowlist, 'quantize': args.ocr_quantize
+    }
+    if any(value is not None for value in ocr_overrides.values()):
+        ocr.configure(**ocr_overrides)
+
+    banks = [bank.strip() for bank in args.banks.split(',') if bank.strip()]
+    months = utils.parse_months(args.months) if args.months else [utils.get_current_sheet_month()]
+    year = args.year or utils.get_current_year()
+
+    # Com vários meses, cada um precisa da sua subpasta; a pasta do ano só serve para um mês
+    args.allow_year_folder = len(months) == 1
+
+    summaries = asyncio.run(run_pipeline(banks, months, year, args))
+    ocr.shutdown_pool()
+    ledger.close()
+    print_summary(summaries)
+
+    if any(summary['status'] != 'ok' for summary in summaries):
+        sys.exit(1)
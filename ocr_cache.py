@@ -0,0 +1,162 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from utils import Utils as utils
+
+class OcrCache:
+
+    # Limite total do cache em disco; as entradas menos usadas saem primeiro
+    max_bytes = int(os.environ.get('FINANCETRACK_OCR_CACHE_MB', '256')) * 1024 * 1024
+    enabled = True
+
+    def get_cache_dir():
+        return utils.get_state_dir('ocr_cache')
+
+    def file_md5(path):
+        # Aceita o caminho do arquivo, o conteúdo já em memória ou uma imagem decodificada
+        # (ndarray: pixels + formato, como em ScreenshotStitcher.get_region_id)
+        if isinstance(path, (bytes, bytearray, memoryview)):
+            return hashlib.md5(path).hexdigest()
+        if hasattr(path, 'tobytes') and hasattr(path, 'shape'):
+            digest = hashlib.md5(path.tobytes())
+            digest.update(repr(path.shape).encode())
+            return digest.hexdigest()
+
+        digest = hashlib.md5()
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def build_key(content_id, settings):
+        # Chave = conteúdo da imagem (md5Checksum do Drive ou md5 local) + configurações do OCR
+        payload = json.dumps({'content': content_id, 'settings': settings}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get_entry_path(self, key):
+        return os.path.join(self.get_cache_dir(), f"{key}.json")
+
+    @classmethod
+    def get(self, key):
+        if not self.enabled:
+            return None
+
+        path = self.get_entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                entry = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        # Atualiza o mtime para servir de "último acesso" na política LRU; outra thread
+        # pode ter removido a entrada (evict) logo depois da leitura
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass
+        return [tuple(detection) for detection in entry['detections']]
+
+    @classmethod
+    def put(self, key, detections, metadata=None):
+        detections = [self.to_builtin(detection) for detection in detections]
+        if not self.enabled:
+            return detections
+
+        entry = {
+            'created_at': time.time(),
+            'metadata': metadata or {},
+            'detections': detections
+        }
+        path = self.get_entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(entry, fh, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        self.evict()
+        return [tuple(detection) for detection in detections]
+
+    def to_builtin(detection):
+        # readtext devolve numpy ints/floats; converte para tipos serializáveis em JSON
+        bbox, text, confidence = detection
+        points = [[coord.item() if hasattr(coord, 'item') else coord for coord in point] for point in bbox]
+        confidence = confidence.item() if hasattr(confidence, 'item') else confidence
+        return [points, text, confidence]
+
+    @classmethod
+    def list_entries(self):
+        entries = []
+        with os.scandir(self.get_cache_dir()) as it:
+            for item in it:
+                if item.is_file() and item.name.endswith('.json'):
+                    stat = item.stat()
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+        return entries
+
+    @classmethod
+    def evict(self):
+        entries = sorted(self.list_entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    @classmethod
+    def invalidate(self, file_id=None, content_id=None):
+        # Sem filtros, limpa o cache inteiro
+        removed = 0
+        for _, _, path in self.list_entries():
+            if file_id is not None or content_id is not None:
+                try:
+                    with open(path, 'r', encoding='utf-8') as fh:
+                        metadata = json.load(fh).get('metadata', {})
+                except (FileNotFoundError, json.JSONDecodeError):
+                    continue
+                if file_id is not None and metadata.get('file_id') != file_id:
+                    continue
+                if content_id is not None and metadata.get('content_id') != content_id:
+                    continue
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    @classmethod
+    def stats(self):
+        entries = self.list_entries()
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'dir': os.path.abspath(self.get_cache_dir())
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gerencia o cache de resultados do OCR")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Mostra o tamanho atual do cache")
+    invalidate_parser = subparsers.add_parser('invalidate', help="Remove entradas do cache")
+    invalidate_parser.add_argument('--file-id', help="Remove apenas as entradas deste arquivo do Drive")
+    invalidate_parser.add_argument('--md5', help="Remove apenas as entradas com este md5Checksum")
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        print(json.dumps(OcrCache.stats(), indent=2))
+    else:
+        removed = OcrCache.invalidate(file_id=args.file_id, content_id=args.md5)
+        print(f"{removed} entradas removidas do cache de OCR")
@@ -1,59 +1,415 @@
-import easyocr
+import os
 import re
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import repeat
 import pandas as pd
 from utils import Utils as utils
+from bank_profiles import BankProfiles as profiles
+from ocr_cache import OcrCache as cache
+from instrumentation import Instrumentation as instrumentation
+from image_preprocessor import ImagePreprocessor as preprocessor
+from transaction_parser import TransactionParser as parser, TransactionIndex
 from datetime import datetime
+from importlib import metadata
+
+# Modos de inferência. fast_cpu troca um pouco de precisão por latência em máquinas sem GPU:
+# - gpu=False não tenta carregar o modelo na GPU;
+# - canvas_size menor reduz a área que o detector CRAFT percorre (prints muito altos perdem
+#   resolução e textos pequenos podem sumir);
+# - batch_size maior agrupa os recortes no reconhecedor (mais memória, menos chamadas).
+# Threads ficam no padrão do torch (núcleos físicos; os lógicos do SMT só disputariam o mesmo
+# núcleo) e a quantização int8 do reconhecedor já é o padrão do EasyOCR na CPU.
+OCR_MODES = {
+    'default': {'threads': None, 'reader': {}, 'readtext': {}},
+    'fast_cpu': {
+        'threads': None,
+        'reader': {'gpu': False},
+        'readtext': {'canvas_size': 1280, 'batch_size': 8}
+    }
+}
+
+# Restringe o reconhecedor a valores/datas; só serve para recortes sem descrição em texto
+DIGITS_ALLOWLIST = '0123456789R$/.,-'
+# Nomes aceitos em --ocr-allowlist no lugar dos caracteres
+ALLOWLISTS = {'digits': DIGITS_ALLOWLIST}
 
 class OcrProcessor:
 
-    reader = easyocr.Reader(['pt'])
+    languages = ['pt']
+    mode = 'default'
+    threads = None
+    reader_params = {}
+    readtext_params = {}
+    # Criado no primeiro OCR (ou em warm_up): importar o módulo não carrega torch/easyocr
+    reader = None
+
+    # Execução paralela: cada processo do pool mantém o seu próprio easyocr.Reader
+    workers = int(os.environ.get('FINANCETRACK_OCR_WORKERS', '1'))
+    batched = os.environ.get('FINANCETRACK_OCR_BATCHED', '0') == '1'
+    batch_images = 4
+    # Preset de pré-processamento das imagens (off, accurate, balanced, fast)
+    preprocess = os.environ.get('FINANCETRACK_OCR_PREPROCESS', 'off')
+    # Confiança mínima do readtext; abaixo dela a transação é sinalizada para conferência
+    min_confidence = float(os.environ.get('FINANCETRACK_OCR_MIN_CONFIDENCE', '0.5'))
+    # Descarta transações repetidas na emenda entre prints sobrepostos
+    dedup = os.environ.get('FINANCETRACK_DEDUP', '1') == '1'
+    pool = None
+    pool_workers = 0
+    # Vários jobs (threads) podem compartilhar o mesmo Reader e o mesmo pool
+    lock = threading.RLock()
 
     @classmethod
-    def extract_text_from_image(cls, image_path):
-        text = cls.reader.readtext(image_path)
-        final_text = '\n'.join([detection[1] for detection in text])
-        return final_text
+    def configure(cls, mode=None, threads=None, canvas_size=None, batch_size=None, paragraph=None, allowlist=None, quantize=None):
+        # Parâmetros explícitos sobrescrevem os do modo escolhido
+        with cls.lock:
+            mode = mode or cls.mode
+            if mode not in OCR_MODES:
+                raise ValueError(f"Modo de OCR desconhecido: {mode}")
+            config = OCR_MODES[mode]
+
+            reader_params = dict(config['reader'])
+            if quantize is not None:
+                reader_params['quantize'] = quantize
+
+            readtext_params = dict(config['readtext'])
+            allowlist = ALLOWLISTS.get(allowlist, allowlist)
+            overrides = {'canvas_size': canvas_size, 'batch_size': batch_size, 'paragraph': paragraph, 'allowlist': allowlist}
+            readtext_params.update({name: value for name, value in overrides.items() if value is not None})
+
+            cls.mode = mode
+            cls.threads = threads or config['threads']
+            cls.readtext_params = readtext_params
+            if reader_params != cls.reader_params:
+                cls.reader_params = reader_params
+                cls.reader = None
+            if cls.threads:
+                import torch
+                torch.set_num_threads(cls.threads)
+            # Workers antigos foram criados com outra configuração
+            cls.shutdown_pool()
 
     @classmethod
-    def extract_transactions_from_text(self, text, bank_name):
-        # Remove linhas indesejadas e padroniza "RS" para "R$"
-        lines = [
-            line.strip().replace("RS ", "R$ ").replace("Rs ", "R$ ")  # Corrige "RS" para "R$"
-            for line in text.split('\n') 
-            if line.strip() 
-            and not line.startswith(('Cartão', 'Cartão Virtual', 'Cartaio Vinal', 'Subtotal', '——', 'EI Cartão', 'Inclusão de Pagamento', 'USD'))
-        ]
+    def get_reader(cls):
+        with cls.lock:
+            if cls.reader is None:
+                import easyocr
+                cls.reader = easyocr.Reader(cls.languages, **cls.reader_params)
+            return cls.reader
 
-        regex = utils.get_regex_pattern(bank_name)
-        cleaned_transactions = []
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            if re.match(regex[0], line):  # Linha começa com data (nova transação)
-                transaction_parts = [line]  # Inicia com a data
-                i += 1
-                # Agrupa todas as partes da transação até a próxima data
-                while i < len(lines) and not re.match(regex[0], lines[i]):
-                    if not lines[i].startswith('Em processamento'):
-                        sucesso, valor = utils.tryparse_decimal(lines[i])
-                        if sucesso:
-                            lines[i] = f"***{'R$'}***{valor}***"
-                        transaction_parts.append(lines[i])
-                    i += 1
+    @classmethod
+    def warm_up(cls, workers=None):
+        # Carrega o modelo (e sobe o pool) antes do primeiro print, fora do caminho crítico
+        workers = workers or cls.workers
+        if workers > 1:
+            cls.get_pool(workers)
+        else:
+            cls.get_reader()
 
-                # print(transaction_parts)
-                
-                # Junta as partes e corrige a ordem dos campos
-                raw_transaction = " ".join(transaction_parts)
-                corrected_transaction = self.correct_transaction_order(raw_transaction)
-                cleaned_transactions.append(corrected_transaction)
+    def get_easyocr_version():
+        # Lido dos metadados do pacote para não importar o torch só para montar a chave do cache
+        try:
+            return metadata.version('easyocr')
+        except metadata.PackageNotFoundError:
+            return 'unknown'
+
+    @classmethod
+    def get_preprocess_config(cls, bank_name=None, preprocess=None):
+        return preprocessor.get_config(preprocess or cls.preprocess, bank_name)
+
+    @classmethod
+    def get_ocr_settings(cls, preprocess_config=None):
+        # Tudo que altera o resultado do readtext precisa entrar na chave do cache
+        return {
+            'languages': cls.languages,
+            'reader': cls.reader_params,
+            'readtext': cls.readtext_params,
+            'preprocess': preprocess_config,
+            'easyocr': OcrProcessor.get_easyocr_version()
+        }
+
+    @classmethod
+    def get_cache_key(cls, image_path=None, content_id=None, preprocess_config=None):
+        # content_id: md5Checksum (ou id) do arquivo no Drive; sem ele, usa o md5 do arquivo local
+        # (ou dos bytes/pixels, quando a imagem já está em memória)
+        if content_id is None:
+            content_id = cache.file_md5(image_path)
+        return cache.build_key(content_id, cls.get_ocr_settings(preprocess_config))
+
+    @classmethod
+    def is_cached(cls, content_id, bank_name=None):
+        key = cls.get_cache_key(content_id=content_id, preprocess_config=cls.get_preprocess_config(bank_name))
+        return cache.get(key) is not None
+
+    @classmethod
+    def extract_detections_from_image(cls, image_path, content_id=None, file_id=None, bank_name=None):
+        return cls.extract_detections_from_images([image_path], [content_id], [file_id], workers=1, bank_name=bank_name)[0]
+
+    @classmethod
+    def extract_text_from_image(cls, image_path, content_id=None, file_id=None, bank_name=None):
+        detections = cls.extract_detections_from_image(image_path, content_id, file_id, bank_name)
+        return cls.get_text(detections)
+
+    @classmethod
+    def get_pool(cls, workers):
+        with cls.lock:
+            if cls.pool is None or cls.pool_workers != workers:
+                cls.shutdown_pool()
+                # spawn evita herdar o estado interno do torch via fork
+                cls.pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=ocr_worker_init,
+                    initargs=(max(1, (cls.threads or os.cpu_count() or 1) // workers), cls.reader_params)
+                )
+                cls.pool_workers = workers
+            return cls.pool
+
+    @classmethod
+    def shutdown_pool(cls):
+        with cls.lock:
+            if cls.pool is not None:
+                cls.pool.shutdown()
+                cls.pool = None
+                cls.pool_workers = 0
+
+    @classmethod
+    def run_readtext(cls, images, batched=False, preprocess_config=None):
+        images = [preprocessor.apply(image, preprocess_config) for image in images]
+        if not batched or len(images) == 1:
+            reader = cls.get_reader()
+            return [reader.readtext(image, **cls.readtext_params) for image in images]
+
+        # readtext_batched exige imagens do mesmo tamanho: agrupa por dimensão
+        arrays = [preprocessor.load(image) for image in images]
+        groups = {}
+        for index, array in enumerate(arrays):
+            groups.setdefault(array.shape, []).append(index)
+
+        reader = cls.get_reader()
+        results = [None] * len(images)
+        for indexes in groups.values():
+            detections = reader.readtext_batched([arrays[i] for i in indexes], **cls.readtext_params)
+            for index, detection in zip(indexes, detections):
+                results[index] = detection
+        return results
+
+    @classmethod
+    def run_readtext_locked(cls, images, batched=False, preprocess_config=None):
+        with cls.lock:
+            return cls.run_readtext(images, batched, preprocess_config)
+
+    @classmethod
+    def run_readtext_timed(cls, images, batched=False, preprocess_config=None):
+        # Um span por imagem (ou por lote no modo batched)
+        with instrumentation.stage('ocr', images=len(images)):
+            return cls.run_readtext_locked(images, batched, preprocess_config)
+
+    @classmethod
+    def extract_detections_from_images(cls, images, content_ids=None, file_ids=None, workers=None, batched=None,
+                                       bank_name=None, preprocess=None, use_cache=True):
+        # images: caminhos, bytes ou ndarrays; retorna as detecções na mesma ordem.
+        # Com content_id informado, a imagem pode ser None se já estiver no cache.
+        workers = cls.workers if workers is None else workers
+        batched = cls.batched if batched is None else batched
+        content_ids = content_ids or [None] * len(images)
+        file_ids = file_ids or [None] * len(images)
+        preprocess_config = cls.get_preprocess_config(bank_name, preprocess)
+
+        if use_cache:
+            keys = [cls.get_cache_key(image, content_id, preprocess_config) for image, content_id in zip(images, content_ids)]
+            detections = [cache.get(key) for key in keys]
+        else:
+            keys = [None] * len(images)
+            detections = [None] * len(images)
+        missing = [i for i, detection in enumerate(detections) if detection is None]
+        instrumentation.count('ocr_cache_hits', len(images) - len(missing))
+
+        if missing:
+            size = cls.batch_images if batched else 1
+            chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
+            tasks = [[images[i] for i in chunk] for chunk in chunks]
+
+            if workers > 1 and len(missing) > 1:
+                pool = cls.get_pool(workers)
+                count = len(tasks)
+                # Os processos não enxergam o trace: mede o lote inteiro
+                with instrumentation.stage('ocr', images=len(missing), workers=workers):
+                    results = list(pool.map(ocr_worker_run, tasks, [cls.readtext_params] * count, [batched] * count, [preprocess_config] * count))
             else:
-                i += 1
+                results = (cls.run_readtext_timed(task, batched, preprocess_config) for task in tasks)
+
+            for chunk, chunk_detections in zip(chunks, results):
+                for i, detection in zip(chunk, chunk_detections):
+                    detections[i] = cls.store_detections(keys[i], detection, images[i], content_ids[i], file_ids[i])
+
+        return detections
+
+    def store_detections(key, detection, image, content_id=None, file_id=None):
+        # Sem chave (use_cache=False) só converte para tipos nativos
+        if key is None:
+            return [tuple(cache.to_builtin(item)) for item in detection]
+        return cache.put(key, detection, metadata={
+            'file_id': file_id,
+            'content_id': content_id,
+            'image_path': image if isinstance(image, str) else None
+        })
+
+    @classmethod
+    def iter_detections_from_images(cls, entries, workers=None, bank_name=None, preprocess=None, use_cache=True,
+                                    crop_bands=True, batched=None):
+        # entries: iterável de (imagem, content_id, file_id), consumido sob demanda; imagem e
+        # content_id None (recorte vazio do stitching) não têm nada a ler.
+        # Gera as detecções na mesma ordem assim que cada imagem fica pronta; com o pool,
+        # no máximo 2 * workers lotes ficam em OCR (e em memória) ao mesmo tempo.
+        # batched: junta até batch_images imagens fora do cache por chamada ao readtext
+        # (readtext_batched para as de mesmo tamanho), como no extract_detections_from_images.
+        # crop_bands=False: as imagens já são recortes sem cabeçalho/rodapé do app.
+        workers = cls.workers if workers is None else workers
+        batched = cls.batched if batched is None else batched
+        batch_size = cls.batch_images if batched else 1
+        preprocess_config = cls.get_preprocess_config(bank_name, preprocess)
+        if preprocess_config is not None and not crop_bands:
+            preprocess_config = dict(preprocess_config, header_band=0.0, footer_band=0.0)
+        pool = cls.get_pool(workers) if workers > 1 else None
+        # Sem pool e sem lote o OCR roda aqui mesmo e cada resultado sai na hora
+        limit = (2 * workers if pool is not None else 1) * batch_size - 1
+        window = deque()
+        # Entradas do window ainda esperando o lote completar: [chave, imagem, content_id, file_id, resultado, índice]
+        batch = []
+
+        def submit():
+            images = [entry[1] for entry in batch]
+            if pool is not None:
+                future = pool.submit(ocr_worker_run, images, cls.readtext_params, batched, preprocess_config)
+                for index, entry in enumerate(batch):
+                    entry[4], entry[5] = future, index
+            else:
+                detections = cls.run_readtext_timed(images, batched, preprocess_config)
+                for entry, detection in zip(batch, detections):
+                    entry[4] = cls.store_detections(entry[0], detection, entry[1], entry[2], entry[3])
+                    # A imagem só fica referenciada enquanto o OCR dela não termina
+                    entry[1] = None
+            batch.clear()
+
+        def resolve(entry):
+            if entry[4] is None:
+                # Lote ainda incompleto: vai para o OCR como está
+                submit()
+            key, image, content_id, file_id, result, index = entry
+            if not isinstance(result, Future):
+                return result
+            # Tempo em que o consumidor ficou esperando o pool
+            with instrumentation.stage('ocr_wait', images=1):
+                detection = result.result()[index]
+            return cls.store_detections(key, detection, image, content_id, file_id)
+
+        for image, content_id, file_id in entries:
+            empty = image is None and content_id is None
+            key = cls.get_cache_key(image, content_id, preprocess_config) if use_cache and not empty else None
+            result = cache.get(key) if key is not None else None
+            entry = [key, None, content_id, file_id, result, 0]
+            if empty:
+                entry[4] = []
+            elif result is not None:
+                instrumentation.count('ocr_cache_hits')
+            else:
+                entry[1] = image
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    submit()
+            window.append(entry)
+            while len(window) > limit:
+                yield resolve(window.popleft())
+
+        while window:
+            yield resolve(window.popleft())
+
+    @classmethod
+    def extract_texts_from_images(cls, images, content_ids=None, file_ids=None, workers=None, batched=None,
+                                  bank_name=None, preprocess=None, use_cache=True):
+        detections = cls.extract_detections_from_images(
+            images, content_ids, file_ids, workers, batched, bank_name, preprocess, use_cache
+        )
+        return [OcrProcessor.get_text(image_detections) for image_detections in detections]
+
+    def get_text(image_detections):
+        return '\n'.join([detection[1] for detection in image_detections])
+
+    def get_confidence_stats(image_detections):
+        confidences = [detection[2] for detection in image_detections]
+        if not confidences:
+            return {'detections': 0, 'min': None, 'mean': None}
+        return {'detections': len(confidences), 'min': min(confidences), 'mean': sum(confidences) / len(confidences)}
+
+    @classmethod
+    def get_low_confidence_transactions(cls, transactions, image_detections, bank_name, threshold=None):
+        # Associa cada trecho lido com pouca confiança à transação que o contém.
+        # O trecho passa pelas mesmas correções de linha do parser antes da comparação e
+        # precisa aparecer como palavras inteiras ("6,7" não marca "76,76", nem "LOJA" marca "LOJAS")
+        threshold = cls.min_confidence if threshold is None else threshold
+        weak = [
+            (line, re.compile(r'(?<![\w.,])' + re.escape(line) + r'(?![\w.,])').search, detection[2])
+            for detection in image_detections if detection[2] < threshold
+            for line in parser.iter_lines([detection[1]], bank_name)
+        ]
+        flagged = []
+        for transaction in transactions:
+            hits = [(line, confidence) for line, search, confidence in weak if search(transaction)]
+            if hits:
+                flagged.append({
+                    'transaction': transaction,
+                    'confidence': round(min(confidence for _, confidence in hits), 4),
+                    'fragments': [line for line, _ in hits]
+                })
+        return flagged
+
+    @classmethod
+    def extract_transactions_from_text(self, text, bank_name):
+        # Regras de cada banco ficam em bank_profiles; o parser compila os padrões uma vez
+        return list(self.iter_transactions_from_text(text, bank_name))
+
+    def iter_transactions_from_text(text, bank_name):
+        # text: texto inteiro ou iterável de linhas (ex.: as linhas de vários prints encadeadas)
+        return (transaction['text'] for transaction in parser.iter_transactions(text, bank_name))
+
+    @classmethod
+    def iter_transactions_from_screenshots(cls, texts, bank_name, dedup=None, with_tags=False):
+        # texts: iterável com o texto de cada print, na ordem da fatura. Uma transação pode
+        # começar em um print e terminar no seguinte; repetições na emenda são descartadas.
+        # with_tags: gera (posição do print em texts, transação)
+        dedup = cls.dedup if dedup is None else dedup
+
+        def iter_tagged_lines():
+            previous_lines = []
+            for tag, text in enumerate(texts):
+                lines = [line for line in text.split('\n') if line.strip()]
+                if dedup:
+                    # Linhas que o print repete do fim do anterior (transação cortada pela borda)
+                    stripped = [line.strip() for line in lines]
+                    overlap = parser.get_line_overlap(previous_lines, stripped)
+                    instrumentation.count('duplicate_lines', overlap)
+                    previous_lines, lines = stripped, lines[overlap:]
+                for line in lines:
+                    yield tag, line
+
+        tagged_lines = iter_tagged_lines()
+        index = TransactionIndex()
+        for tag, transaction in parser.iter_tagged_transactions(tagged_lines, bank_name):
+            transaction['tag'] = tag
+            released = index.add(tag, transaction) if dedup else [transaction]
+            for item in released:
+                yield (item['tag'], item['text']) if with_tags else item['text']
+        for item in index.flush():
+            yield (item['tag'], item['text']) if with_tags else item['text']
+        instrumentation.count('duplicate_transactions', index.removed)
+
+    @classmethod
+    def extract_transactions_from_screenshots(cls, texts, bank_name, dedup=None):
+        return list(cls.iter_transactions_from_screenshots(texts, bank_name, dedup))
 
-        # sorted_transactions = sorted(cleaned_transactions, key=lambda item: datetime.strptime(item.split()[0], "%d/%m"), reverse=True)
-        # print(f"Transações extraídas: {sorted_transactions}")
-        return cleaned_transactions
-    
     @classmethod
     def extract_transactions_from_textt(self, text, bank_name):
         # Remove linhas indesejadas e padroniza "RS" para "R$"
@@ -105,147 +461,125 @@ class OcrProcessor:
         return sorted_transactions
 
     def correct_transaction_order(raw_transaction):
-        # Padroniza "RS" para "R$" e remove espaços extras
-        raw_transaction = raw_transaction.replace("RS ", "R$ ").replace("Rs ", "R$ ").strip()
-        
-        # Padrão 1: Descrição ANTES do valor (ex: "01/08 PG 'B4A GLAMBOX R$ 76,76 Parcela")
-        pattern_normal = re.compile(
-            r'(\d{2}/\d{2})\s+'          # Data (DD/MM)
-            r'(.*?)\s+'                   # Descrição (não guloso)
-            r'(R\$\s+[\d.,]+)\s*'        # Valor (R$ X,XX)
-            r'(.*)'                       # Parcelamento (opcional)
-        )
-        
-        # Padrão 2: Valor ANTES da descrição (ex: "17/02 R$ 58,13 APP 'MONTISTUDIO")
-        pattern_inverted = re.compile(
-            r'(\d{2}/\d{2})\s+'          # Data
-            r'(R\$\s+[\d.,]+)\s+'        # Valor
-            r'(.+?)\s+(?=(R\$|Parcela))'                   # Descrição + Parcelamento
-            r'(Parcela \d+ de \d+)?'      # Parcelamento (opcional)
-        )
+        return parser.parse_transaction(raw_transaction)['text']
 
-        # Padrão 3:
-        pattern_full_date = re.compile(
-            r'(\d{2}/\d{2}/\d{4})\s+'     # Data
-            r'(.*?)\s+'                   # Descrição (não guloso)
-            r'(R\$\s+[\d.,]+)\s+'         # Valor
-            r'(.*)'                       # Parcelamento (opcional)
-        ) 
-
-        # Padrão 4:
-        pattern_full_date_parcela = re.compile(
-            r'(\d{2}/\d{2}/(?:\d{2}|\d{4}))\s+'  # Data (dd/mm/aa OU dd/mm/aaaa)
-            r'(.+?)\s+'                          # Descrição (não gulosa, até o próximo padrão)
-            r'(?:Parcela\s+(\d+ de \d+)\s+)?'       # Parcelamento (opcional)
-            r'(R\$\s+[\d.,]+)'                   # Valor (R$24,15 ou R$ 24,15)
-        )        
-        
-        # Tenta o padrão normal (descrição antes do valor)
-        match_normal = pattern_normal.search(raw_transaction)
-        if match_normal:
-            data, descricao, valor, parcelamento = match_normal.groups()
-            text_formatted = f"{data} {descricao.strip()} {valor} {parcelamento.strip()}".strip()
-            return text_formatted
-        
-        # Tenta o padrão invertido (valor antes da descrição)
-        match_inverted = pattern_inverted.search(raw_transaction)
-        if match_inverted:
-            data, valor, resto, _, parcelamento = match_inverted.groups()
-            if parcelamento and parcelamento in resto:
-                descricao = resto.replace(parcelamento, "").strip()
-            else:
-                descricao = resto.strip()
-            text_formatted = f"{data} {descricao} {valor} {parcelamento if parcelamento else ''}".strip()
-            return text_formatted
-        
-        # Tenta o padrão normal (descrição antes do valor)
-        match_full_date = pattern_full_date.search(raw_transaction)
-        if match_full_date:
-            data, descricao, valor, hora = match_full_date.groups()
-            text_formatted = f"{data} {descricao.strip()} {valor} {hora.strip()}".strip()
-            return text_formatted
-        
-        match_full_date_parcela = pattern_full_date_parcela.search(raw_transaction)
-        if match_full_date_parcela:
-            data, descricao, parcelamento, valor = match_full_date_parcela.groups()
-            text_formatted = f"{data} {descricao.strip()} {valor} {parcelamento if parcelamento else '-'}".strip()       
-            return text_formatted    
-        
-        # Se nenhum padrão for encontrado, retorna o original (para debug)
-        # print(f"⚠️ Transação não parseada: {raw_transaction}")
-        return raw_transaction
-
-    @classmethod
-    def parse_credit_card_statement(self, text):
+    @classmethod
+    def parse_credit_card_statement(self, text, bank_name, year=None, sources=None):
+        # text: lista (ou iterável) das transações já agrupadas; sources: id do arquivo de
+        # origem de cada uma (opcional, vira a coluna 'source'). A data que abre cada
+        # transação segue o perfil do banco, como no TransactionParser.
+        # Os regex rodam num único laço (o .str.extract do pandas também é um laço Python, só
+        # que um por padrão); as colunas tipadas são convertidas de uma vez no final
+        if sources is None:
+            transacoes = self.clean_extracted_text("\n".join(text), bank_name)
+        else:
+            text = list(text)
+            line_sources = [source for transaction, source in zip(text, sources) for _ in transaction.split('\n')]
+            transacoes, transacoes_sources = self.clean_extracted_text("\n".join(text), bank_name, line_sources)
 
+        # Padrão 1: data do perfil (DD/MM no c6), valor sem o "R$"
         pattern = re.compile(
-            r'(\d{2}/\d{2})\s+'          # Data (DD/MM)
+            f"({profiles.get(bank_name)['date_format']})" r'\s+'  # Data
             r'(.+?)\s+'                   # Descrição (até o valor)
-            r'R\$\s+([\d.,]+)'            # Valor (R$ 150,90)
+            r'(-\s*)?R\$\s+(-\s*)?([\d.,]+)'  # Valor (R$ 150,90; estorno: -R$ 150,90 ou R$ -150,90)
             r'(?:\s+Parcela\s+(\d+)\s+ de \s+(\d+))?'  # Parcelamento (opcional)
         )
-
+        # Padrão 2: data completa DD/MM/AAAA, valor com o "R$"
         pattern_full_date = re.compile(
             r'(\d{2}/\d{2}/\d{4})\s+'     # Data
             r'(.*?)\s+'                   # Descrição (não guloso)
-            r'(R\$\s+[\d.,]+)\s+'         # Valor
-            r'(Parcela \d+ de \d+)?'      # Parcelamento (opcional)
+            r'(-\s*)?(R\$\s+)(-\s*)?([\d.,]+)\s+'  # Valor (com sinal, se estorno)
+            r'(Parcela (\d+) de (\d+))?'      # Parcelamento (opcional)
         )
+        starts_full_date = re.compile(r'\d{2}/\d{2}/\d{4}').match
+        # Parcelas numéricas procuradas na transação inteira
+        find_parcela = re.compile(r'Parcela\s+(\d+)\s+de\s+(\d+)').search
+        find_amount = re.compile(r'(\d+)(?:,(\d{1,2}))?').search
 
-        inlineText = "\n".join(text)
-
-        transacoes_limpas = self.clean_extracted_text(inlineText)
-        transacoes_formatted = []
-        # print(f"Transações limpas: {transacoes_limpas}")
-        for transacao in transacoes_limpas:
+        rows, row_sources = [], []
+        for position, transacao in enumerate(transacoes):
+            # Cada transação entra uma única vez: a data completa só vence quando a
+            # linha começa com ela (senão o padrão 1 pegaria uma data no meio do texto)
             match = pattern.search(transacao)
-            if match:
-                data, descricao, valor, parcela_atual, parcela_total = match.groups()
-                # print(f"Transação 1: {data} {descricao} {valor} {parcela_atual} de {parcela_total}")
-                transacoes_formatted.append({
-                    'Data': data,
-                    'Descrição': descricao.strip(),
-                    'Parcela': f"{parcela_atual or '-'}/{parcela_total or '-'}",
-                    'Valor': valor.replace('.', '')
-                })
-
-            match_full_date = pattern_full_date.search(transacao)
+            match_full_date = pattern_full_date.search(transacao) if match is None or starts_full_date(transacao) else None
             if match_full_date:
-                data, descricao, valor, parcelamento = match_full_date.groups()
-                # print(f"Transação 2: {data} {descricao} {valor} {parcelamento}")
-                transacoes_formatted.append({
-                    'Data': data,
-                    'Descrição': descricao.strip(),
-                    'Parcela': f"{parcelamento or '-'}",
-                    'Valor': valor.replace('.', '')
-                })
+                data, descricao, sinal, prefixo, sinal_valor, valor, parcelamento, _, _ = match_full_date.groups()
+                parcela = parcelamento or '-'
+                valor = prefixo + valor
+            elif match:
+                data, descricao, sinal, sinal_valor, valor, parcela_atual, parcela_total = match.groups()
+                parcela = f"{parcela_atual or '-'}/{parcela_total or '-'}"
+            else:
+                continue
+
+            valor = valor.replace('.', '')
+            negativo = sinal is not None or sinal_valor is not None
+            amount = find_amount(valor)
+            centavos = int(amount[1]) * 100 + int((amount[2] or '').ljust(2, '0')) if amount else None
+            parcelas = find_parcela(transacao)
+            rows.append((
+                data, descricao.strip(), parcela, f"-{valor}" if negativo else valor,
+                -centavos if negativo and centavos is not None else centavos,
+                parcelas[1] if parcelas else None, parcelas[2] if parcelas else None
+            ))
+            if sources is not None:
+                row_sources.append(transacoes_sources[position])
+
+        df = pd.DataFrame(rows, columns=['Data', 'Descrição', 'Parcela', 'Valor', 'valor_centavos', 'parcela_atual', 'parcela_total'])
+        if sources is not None:
+            df['source'] = row_sources
+
+        # Colunas tipadas: data completa, valor em centavos e parcelas como inteiros
+        year = str(year or utils.get_current_year())
+        # Separadores do formato do perfil (05-10, 05.10) viram "/"
+        datas = df['Data'].str.replace(r'\D+', '/', regex=True)
+        datas = datas.where(datas.str.len() > 5, datas + '/' + year)
+        df['data_lancamento'] = pd.to_datetime(datas, format='%d/%m/%Y', errors='coerce')
+        df['valor_centavos'] = df['valor_centavos'].astype('Int64')
+        df['parcela_atual'] = pd.to_numeric(df['parcela_atual']).astype('Int64')
+        df['parcela_total'] = pd.to_numeric(df['parcela_total']).astype('Int64')
 
-        return pd.DataFrame(transacoes_formatted, columns=['Data', 'Descrição', 'Parcela', 'Valor'])
+        columns = ['Data', 'Descrição', 'Parcela', 'Valor', 'data_lancamento', 'valor_centavos', 'parcela_atual', 'parcela_total']
+        return df[columns + ['source'] if sources is not None else columns]
 
-    def clean_extracted_text(text):
-        # Remove caracteres estranhos e linhas irrelevantes
+    def clean_extracted_text(text, bank_name, sources=None):
+        # Remove caracteres estranhos e linhas irrelevantes (prefixos de ruído do perfil do banco)
         text = re.sub(r'Í\?ª\.|tm|Cartão virtual \d+', '', text)
-        
-        # Separa as linhas e filtra as válidas
-        lines = [
-            line.strip() for line in text.split('\n') 
-            if line.strip() 
-            and not any(word in line for word in ['Cartão', 'Subtotal', '——'])
-        ]
-        
-        # Agrupa linhas que pertencem à mesma transação
-        cleaned_transactions = []
-        current_transaction = []
-        
-        for line in lines:
-            if re.match(r'\d{2}/\d{2}', line):  # Nova transação
-                if current_transaction:
-                    cleaned_transactions.append(" ".join(current_transaction))
-                current_transaction = [line]
-            else:
-                current_transaction.append(line)
-        
-        if current_transaction:
-            cleaned_transactions.append(" ".join(current_transaction))
-        
-        return cleaned_transactions
\ No newline at end of file
+        compiled = parser.get_compiled(bank_name)
+        is_date = compiled['date']
+        noise_prefixes = compiled['noise_prefixes']
+
+        # Agrupa linhas que pertencem à mesma transação: cada data abre um grupo novo.
+        # Um laço simples: juntar grupo a grupo com o pandas custa uma chamada Python por grupo
+        transacoes, origens, current = [], [], []
+        for line, source in zip(text.split('\n'), sources if sources is not None else repeat(None)):
+            line = line.strip()
+            if not line or line.startswith(noise_prefixes):
+                continue
+            if is_date(line) and current:
+                transacoes.append(" ".join(current))
+                current = []
+            if not current:
+                origens.append(source)
+            current.append(line)
+        if current:
+            transacoes.append(" ".join(current))
+
+        # Com sources (um por linha), cada transação fica com a origem da sua primeira linha
+        return transacoes if sources is None else (transacoes, origens)
+
+def ocr_worker_init(threads, reader_params=None):
+    # Cada processo usa poucas threads do torch para não disputar núcleos com os demais
+    import torch
+    torch.set_num_threads(threads)
+    # O modelo é carregado aqui, na subida do processo, e não no primeiro lote
+    OcrProcessor.reader_params = reader_params or {}
+    OcrProcessor.get_reader()
+
+
+def ocr_worker_run(images, readtext_params, batched, preprocess_config=None):
+    OcrProcessor.readtext_params = readtext_params
+    return [
+        [cache.to_builtin(detection) for detection in image_detections]
+        for image_detections in OcrProcessor.run_readtext(images, batched, preprocess_config)
+    ]
@@ -0,0 +1,85 @@
+import argparse
+import os
+import re
+from instrumentation import Instrumentation as instrumentation
+from ocr_processor import OcrProcessor as ocr
+
+PDF_MIME = 'application/pdf'
+
+class PdfExtractor:
+
+    # Página com menos caracteres que isso na camada de texto é tratada como digitalizada (vai para o OCR)
+    min_chars = int(os.environ.get('FINANCETRACK_PDF_MIN_CHARS', '20'))
+    # Escala da renderização para o OCR (1.0 = 72 dpi)
+    render_scale = 2.0
+
+    def is_pdf(item):
+        return item.get('mimeType') == PDF_MIME or item.get('name', '').lower().endswith('.pdf')
+
+    def get_page_content_id(content_id, index):
+        # Chave do cache de OCR de uma página renderizada; sem content_id, o cache usa os pixels
+        return f"{content_id}#p{index + 1}" if content_id else None
+
+    def clean_text(text):
+        # Camada de texto do pdfium: quebras \r\n e espaços repetidos do alinhamento em colunas
+        lines = (re.sub(r'\s+', ' ', line).strip() for line in re.split(r'\r\n|\r|\n', text))
+        return "\n".join(line for line in lines if line)
+
+    @classmethod
+    def iter_pages(self, source, content_id=None, file_id=None, bank_name=None):
+        # source: caminho ou bytes do PDF. Gera {'page', 'text', 'detections'} página a página;
+        # só a página atual (e o seu bitmap, se precisar de OCR) fica carregada
+        import pypdfium2 as pdfium
+
+        document = pdfium.PdfDocument(source)
+        try:
+            for index in range(len(document)):
+                page = document[index]
+                try:
+                    textpage = page.get_textpage()
+                    text = self.clean_text(textpage.get_text_range())
+                    textpage.close()
+
+                    if len(text.replace(' ', '').replace('\n', '')) >= self.min_chars:
+                        instrumentation.count('pdf_text_pages')
+                        yield {'page': index + 1, 'text': text, 'detections': []}
+                        continue
+
+                    # Página sem texto (digitalizada): renderiza e passa pelo OCR, com cache por página
+                    instrumentation.count('pdf_ocr_pages')
+                    bitmap = page.render(scale=self.render_scale)
+                    image = bitmap.to_numpy().copy()
+                    bitmap.close()
+                    entries = [(image, self.get_page_content_id(content_id, index), file_id)]
+                    detections = next(ocr.iter_detections_from_images(entries, workers=1, bank_name=bank_name, crop_bands=False))
+                    yield {'page': index + 1, 'text': ocr.get_text(detections), 'detections': detections}
+                finally:
+                    page.close()
+        finally:
+            document.close()
+
+    @classmethod
+    def extract(self, source, content_id=None, file_id=None, bank_name=None):
+        # Texto do PDF inteiro e as detecções das páginas que passaram pelo OCR
+        text, detections = [], []
+        for page in self.iter_pages(source, content_id, file_id, bank_name):
+            text.append(page['text'])
+            detections.extend(page['detections'])
+        return "\n".join(text), detections
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extrai as transações de uma fatura em PDF")
+    parser.add_argument('pdf')
+    parser.add_argument('--bank', default='c6')
+    parser.add_argument('--text', action='store_true', help="Mostra o texto de cada página em vez das transações")
+    args = parser.parse_args()
+
+    if args.text:
+        for page in PdfExtractor.iter_pages(args.pdf, bank_name=args.bank):
+            origem = 'OCR' if page['detections'] else 'texto'
+            print(f"--- página {page['page']} ({origem}) ---\n{page['text']}")
+    else:
+        text, _ = PdfExtractor.extract(args.pdf, bank_name=args.bank)
+        for transaction in ocr.extract_transactions_from_text(text, args.bank):
+            print(transaction)
@@ -0,0 +1,173 @@
+import argparse
+import hashlib
+import os
+from bank_profiles import BankProfiles as profiles
+from image_preprocessor import ImagePreprocessor as preprocessor
+
+class ScreenshotStitcher:
+
+    # Prints tirados rolando a fatura se sobrepõem; com o stitching cada print só manda
+    # para o OCR a faixa que ainda não apareceu no anterior
+    enabled = os.environ.get('FINANCETRACK_STITCH', '0') == '1'
+    # Sobreposição mínima: linhas de pixel iguais seguidas e, delas, quantas com conteúdo
+    min_overlap_rows = 48
+    min_content_rows = 8
+    # Linhas diferentes seguidas toleradas dentro do trecho comum e deslocamentos conferidos
+    max_mismatch_rows = 2
+    max_candidates = 5
+    # Folga, em linhas, para o trecho comum encostar no topo do print atual e no fim do anterior
+    max_edge_rows = 4
+    # Hash de uma a cada N colunas, em 16 tons de cinza: ignora antialiasing e compressão leve
+    column_step = 4
+
+    def get_content_bounds(height, bank_name=None):
+        # Cabeçalho e barra de navegação são fixos na tela: ficam fora da comparação
+        screenshot = profiles.get(bank_name).get('screenshot', {}) if bank_name else {}
+        top = int(height * screenshot.get('header_band', 0.0))
+        bottom = height - int(height * screenshot.get('footer_band', 0.0))
+        return top, max(top, bottom)
+
+    @classmethod
+    def get_signature(self, array):
+        # Um hash por linha de pixels e a máscara das linhas em branco (só fundo)
+        import cv2
+
+        gray = array if array.ndim == 2 else cv2.cvtColor(array, cv2.COLOR_BGR2GRAY)
+        quantized = gray[:, ::self.column_step] >> 4
+        blank = (quantized.max(axis=1) - quantized.min(axis=1)) <= 1
+        hashes = [hashlib.blake2b(row.tobytes(), digest_size=8).digest() for row in quantized]
+        return hashes, blank.tolist()
+
+    @classmethod
+    def find_overlap(self, previous, current):
+        # Procura o deslocamento s em que a linha i do print atual é a linha s + i do anterior.
+        # Cada linha com conteúdo do atual vota nos deslocamentos em que aparece no anterior;
+        # os mais votados são conferidos e vence o que tiver o maior trecho contínuo igual.
+        # O trecho só vale se for a emenda de verdade: começa no topo do print atual e vai até o
+        # fim do anterior (descontadas as faixas fixas da tela); uma linha repetida no meio da
+        # fatura (data, "Em processamento") não conta como sobreposição.
+        # Retorna (s, primeira, última) com o trecho em coordenadas do print atual, ou None.
+        prev_hashes, prev_blank = previous['hashes'], previous['blank']
+        cur_hashes, cur_blank = current['hashes'], current['blank']
+        head, tail = self.get_fixed_rows(prev_hashes, cur_hashes)
+
+        positions = {}
+        for index, row_hash in enumerate(prev_hashes):
+            if not prev_blank[index]:
+                positions.setdefault(row_hash, []).append(index)
+
+        votes = {}
+        for index, row_hash in enumerate(cur_hashes):
+            for position in positions.get(row_hash, ()):
+                if position >= index:
+                    votes[position - index] = votes.get(position - index, 0) + 1
+
+        best = None
+        for shift in sorted(votes, key=votes.get, reverse=True)[:self.max_candidates]:
+            for first, last in self.get_matching_runs(prev_hashes, prev_blank, cur_hashes, cur_blank, shift):
+                at_top = first <= head + self.max_edge_rows
+                at_bottom = shift + last >= len(prev_hashes) - tail - self.max_edge_rows
+                if at_top and at_bottom and (best is None or last - first > best[2] - best[1]):
+                    best = (shift, first, last)
+        return best
+
+    def get_fixed_rows(prev_hashes, cur_hashes):
+        # Linhas iguais na mesma posição da tela no início e no fim dos dois prints (cabeçalho e
+        # barra de navegação que sobraram além das faixas do perfil)
+        length = min(len(prev_hashes), len(cur_hashes))
+        head = 0
+        while head < length and prev_hashes[head] == cur_hashes[head]:
+            head += 1
+        tail = 0
+        while tail < length - head and prev_hashes[-1 - tail] == cur_hashes[-1 - tail]:
+            tail += 1
+        return head, tail
+
+    @classmethod
+    def get_matching_runs(self, prev_hashes, prev_blank, cur_hashes, cur_blank, shift):
+        # Trechos [primeira, última) em que os dois prints coincidem, tolerando poucas linhas
+        # diferentes seguidas e exigindo um mínimo de linhas (e de linhas com conteúdo)
+        length = min(len(prev_hashes) - shift, len(cur_hashes))
+        runs = []
+        first = None
+        content = mismatches = 0
+        for i in range(length + 1):
+            same = i < length and prev_hashes[shift + i] == cur_hashes[i]
+            if same:
+                if first is None:
+                    first, content = i, 0
+                mismatches = 0
+                content += not cur_blank[i]
+                last = i + 1
+                continue
+            mismatches += 1
+            if first is not None and (mismatches > self.max_mismatch_rows or i == length):
+                if last - first >= self.min_overlap_rows and content >= self.min_content_rows:
+                    runs.append((first, last))
+                first = None
+        return runs
+
+    def get_cut(previous, shift, first, last):
+        # Corta numa linha em branco do trecho comum (o mais abaixo possível), para a última
+        # linha de texto do print anterior, em geral cortada pela borda, ser lida inteira no seguinte
+        blank = previous['blank']
+        for row in range(shift + last - 1, shift + first - 1, -1):
+            if blank[row]:
+                return row
+        return shift + last
+
+    def get_region_id(region):
+        # Identifica o recorte pelo conteúdo: a chave do cache de OCR continua valendo entre execuções
+        if region is None:
+            return None
+        digest = hashlib.md5(region.tobytes())
+        digest.update(repr(region.shape).encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def iter_regions(self, images, bank_name=None, stats=None):
+        # Gera, na ordem, a faixa nova de cada print (ndarray) ou None se ele não traz nada novo.
+        # Cada recorte depende do print seguinte, então a saída fica um print atrás da entrada.
+        stats = stats if stats is not None else {}
+        previous = None
+        for image in images:
+            array = preprocessor.load(image)
+            top, bottom = self.get_content_bounds(array.shape[0], bank_name)
+            hashes, blank = self.get_signature(array[top:bottom])
+            current = {'array': array, 'top': top, 'start': 0, 'hashes': hashes, 'blank': blank}
+
+            if previous is not None:
+                end = previous['array'].shape[0]
+                overlap = self.find_overlap(previous, current)
+                if overlap is not None:
+                    shift, first, last = overlap
+                    cut = self.get_cut(previous, shift, first, last)
+                    end = previous['top'] + cut
+                    current['start'] = current['top'] + cut - shift
+                    stats['overlaps'] = stats.get('overlaps', 0) + 1
+                    stats['skipped_rows'] = stats.get('skipped_rows', 0) + cut - shift
+                yield self.get_region(previous, end)
+            previous = current
+
+        if previous is not None:
+            yield self.get_region(previous, previous['array'].shape[0])
+
+    def get_region(entry, end):
+        if end <= entry['start']:
+            return None
+        return entry['array'][entry['start']:end]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mostra a sobreposição detectada entre prints consecutivos")
+    parser.add_argument('images', nargs='+', help="Prints de tela (na ordem da fatura)")
+    parser.add_argument('--bank', default=None)
+    args = parser.parse_args()
+
+    images = sorted(args.images, key=os.path.basename)
+    stats = {}
+    for path, region in zip(images, ScreenshotStitcher.iter_regions(images, args.bank, stats)):
+        height = preprocessor.load(path).shape[0]
+        kept = 0 if region is None else region.shape[0]
+        print(f"{os.path.basename(path)}: {kept}/{height} linhas enviadas ao OCR")
+    print(f"{stats.get('overlaps', 0)} sobreposições, {stats.get('skipped_rows', 0)} linhas puladas")
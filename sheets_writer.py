@@ -0,0 +1,168 @@
+import os
+import random
+import threading
+import time
+
+class SheetsWriter:
+
+    # Retentativas para 429 (cota) e 5xx, com espera exponencial e jitter
+    max_retries = 5
+    base_delay = 1.0
+    max_delay = 32.0
+
+    # Limite de chamadas à API por execução (inclui retentativas)
+    request_budget = int(os.environ.get('FINANCETRACK_SHEETS_BUDGET', '100'))
+    requests_made = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def reset_budget(self):
+        with self.lock:
+            self.requests_made = 0
+
+    @classmethod
+    def spend_request(self):
+        with self.lock:
+            if self.requests_made >= self.request_budget:
+                raise RuntimeError(f"Orçamento de {self.request_budget} chamadas ao Google Sheets esgotado")
+            self.requests_made += 1
+
+    def is_retryable(error):
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+        return status == 429 or (status is not None and 500 <= status < 600)
+
+    @classmethod
+    def call(self, func, *args, **kwargs):
+        from gspread.exceptions import APIError
+
+        attempt = 0
+        while True:
+            self.spend_request()
+            try:
+                return func(*args, **kwargs)
+            except APIError as error:
+                if not self.is_retryable(error) or attempt >= self.max_retries:
+                    raise
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                time.sleep(delay / 2 + random.uniform(0, delay / 2))
+                attempt += 1
+
+    def quote_range(worksheet_name, first_row, first_col, last_row, last_col):
+        from gspread.utils import rowcol_to_a1
+
+        title = worksheet_name.replace("'", "''")
+        return f"'{title}'!{rowcol_to_a1(first_row, first_col)}:{rowcol_to_a1(last_row, last_col)}"
+
+    def get_block_size(target):
+        size = len(target['descricoes'])
+        if target.get('clear_rows'):
+            size = max(size, max(target['clear_rows']) + 1)
+        return size
+
+    def get_cell(values, row, col):
+        # values_batch_get omite linhas e colunas vazias no fim do bloco
+        if row < len(values) and col < len(values[row]):
+            return values[row][col]
+        return ''
+
+    @classmethod
+    def diff_target(self, target, values):
+        # Retorna {(linha, coluna): valor} apenas com as células que precisam mudar
+        col_first = min(target['col_descricao'], target['col_valor'])
+        col_desc = target['col_descricao'] - col_first
+        col_valor = target['col_valor'] - col_first
+        rows = target.get('rows')
+
+        changes = {}
+        for i in (range(len(target['descricoes'])) if rows is None else rows):
+            descricao = target['descricoes'][i]
+            valor = target['valores'][i]
+
+            # Descrição já preenchida na planilha é mantida (pode ter sido editada à mão)
+            descricao_planilha = self.get_cell(values, i, col_desc)
+            if descricao_planilha == '' and descricao != '':
+                changes[(i, target['col_descricao'])] = descricao
+            if self.get_cell(values, i, col_valor) != valor:
+                changes[(i, target['col_valor'])] = valor
+
+        for i in target.get('clear_rows') or []:
+            for col, offset in ((target['col_descricao'], col_desc), (target['col_valor'], col_valor)):
+                if self.get_cell(values, i, offset) != '':
+                    changes[(i, col)] = ''
+
+        return changes
+
+    @classmethod
+    def group_ranges(self, target, changes):
+        # Junta células alteradas consecutivas da mesma coluna em um único intervalo
+        data = []
+        for col in sorted({col for _, col in changes}):
+            rows = sorted(row for row, change_col in changes if change_col == col)
+            run = [rows[0]]
+            for row in rows[1:] + [None]:
+                if row is not None and row == run[-1] + 1:
+                    run.append(row)
+                    continue
+                first = target['start_row'] + run[0]
+                last = target['start_row'] + run[-1]
+                data.append({
+                    'range': self.quote_range(target['worksheet'], first, col, last, col),
+                    'values': [[changes[(r, col)]] for r in run]
+                })
+                if row is not None:
+                    run = [row]
+        return data
+
+    @classmethod
+    def get_block_values(self, target, values, changes):
+        # Bloco inteiro (linhas x colunas) como fica na planilha depois de aplicar as mudanças
+        col_first = min(target['col_descricao'], target['col_valor'])
+        width = max(target['col_descricao'], target['col_valor']) - col_first + 1
+        block = [[self.get_cell(values, row, col) for col in range(width)] for row in range(self.get_block_size(target))]
+        for (row, col), value in changes.items():
+            block[row][col - col_first] = value
+        return block
+
+    @classmethod
+    def write_many(self, spreadsheet, targets):
+        # targets: [{'worksheet', 'start_row', 'col_descricao', 'col_valor', 'descricoes',
+        #            'valores', 'rows' (opcional), 'clear_rows' (opcional), 'values' (opcional)}]
+        # 'values' é o conteúdo atual do bloco, quando já conhecido (projeção do ledger): esses
+        # blocos não são lidos. Faz no máximo duas chamadas: um values.batchGet e um values.batchUpdate
+        targets = [target for target in targets if self.get_block_size(target) > 0]
+        if not targets:
+            return {'cells': 0, 'ranges': 0, 'reads': 0, 'blocks': []}
+
+        ranges = []
+        unknown = [target for target in targets if target.get('values') is None]
+        for target in unknown:
+            first_col = min(target['col_descricao'], target['col_valor'])
+            last_col = max(target['col_descricao'], target['col_valor'])
+            last_row = target['start_row'] + self.get_block_size(target) - 1
+            ranges.append(self.quote_range(target['worksheet'], target['start_row'], first_col, last_row, last_col))
+
+        value_ranges = []
+        if ranges:
+            response = self.call(spreadsheet.values_batch_get, ranges)
+            value_ranges = response.get('valueRanges', [])
+        read_values = {
+            id(target): value_ranges[index].get('values', []) if index < len(value_ranges) else []
+            for index, target in enumerate(unknown)
+        }
+
+        data = []
+        blocks = []
+        cells = 0
+        for target in targets:
+            values = target['values'] if target.get('values') is not None else read_values[id(target)]
+            changes = self.diff_target(target, values)
+            cells += len(changes)
+            if changes:
+                data.extend(self.group_ranges(target, changes))
+            blocks.append(self.get_block_values(target, values, changes))
+
+        if data:
+            self.call(spreadsheet.values_batch_update, body={'valueInputOption': 'RAW', 'data': data})
+
+        # blocks: conteúdo de cada bloco após a escrita, na ordem de targets (sem os vazios)
+        return {'cells': cells, 'ranges': len(data), 'reads': len(ranges), 'blocks': list(zip(targets, blocks))}
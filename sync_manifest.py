@@ -0,0 +1,107 @@
+import json
+import os
+from utils import Utils as utils
+
+class SyncManifest:
+
+    version = 1
+
+    def get_manifest_path(bank, year, month=None):
+        name = f"{bank}_{year}_{month}" if month else f"{bank}_{year}"
+        return os.path.join(utils.get_state_dir('manifests'), f"{name}.json")
+
+    @classmethod
+    def load(self, bank, year, month=None):
+        path = self.get_manifest_path(bank, year, month)
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                manifest = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            manifest = None
+
+        if not manifest or manifest.get('version') != self.version:
+            manifest = {
+                'version': self.version,
+                'bank': bank,
+                'year': str(year),
+                'month': month,
+                'folder_id': None,
+                'page_token': None,
+                'files': {},
+                'rows': []
+            }
+        return manifest
+
+    @classmethod
+    def save(self, manifest):
+        path = self.get_manifest_path(manifest['bank'], manifest['year'], manifest.get('month'))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(manifest, fh, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def is_image(item):
+        return item.get('mimeType', '').startswith('image/') and not item.get('trashed', False)
+
+    @classmethod
+    def is_statement_file(self, item):
+        # Prints ou a fatura em PDF
+        return self.is_image(item) or (item.get('mimeType') == 'application/pdf' and not item.get('trashed', False))
+
+    @classmethod
+    def plan_full(self, manifest, images):
+        # Reconstrução completa: tudo que está na pasta é reprocessado
+        current_ids = {item['id'] for item in images}
+        removed = [file_id for file_id in manifest['files'] if file_id not in current_ids]
+        return list(images), removed
+
+    @classmethod
+    def plan_changes(self, manifest, folder_id, changes):
+        # Filtra as alterações do Drive que afetam a pasta sincronizada
+        changed = {}
+        removed = set()
+        for change in changes:
+            file_id = change['fileId']
+            item = change.get('file') or {}
+            in_folder = folder_id in item.get('parents', [])
+
+            if change.get('removed') or not in_folder or not self.is_statement_file(item):
+                # Apagado, na lixeira ou movido para fora da pasta
+                if file_id in manifest['files']:
+                    removed.add(file_id)
+                changed.pop(file_id, None)
+                continue
+
+            known = manifest['files'].get(file_id)
+            if known and known.get('md5') == item.get('md5Checksum') and known.get('name') == item.get('name'):
+                continue
+            changed[file_id] = item
+            removed.discard(file_id)
+
+        return list(changed.values()), sorted(removed)
+
+    def apply(manifest, items, texts, removed, transactions):
+        for file_id in removed:
+            manifest['files'].pop(file_id, None)
+
+        for item, text in zip(items, texts):
+            manifest['files'][item['id']] = {
+                'name': item['name'],
+                'md5': item.get('md5Checksum'),
+                'modifiedTime': item.get('modifiedTime'),
+                'text': text,
+                'transactions': transactions.get(item['id'], [])
+            }
+
+    def get_ordered_files(manifest):
+        # Mesma ordem usada no processamento completo: nome do arquivo
+        return sorted(manifest['files'].items(), key=lambda entry: entry[1]['name'])
+
+    def diff_rows(old_rows, new_rows):
+        # Posições que mudaram (a escrever) e posições que deixaram de existir (a limpar)
+        changed = [
+            i for i, row in enumerate(new_rows)
+            if i >= len(old_rows) or list(old_rows[i]) != list(row)
+        ]
+        cleared = list(range(len(new_rows), len(old_rows)))
+        return changed, cleared
@@ -0,0 +1,232 @@
+import hashlib
+import re
+from collections import deque
+from bank_profiles import BankProfiles as profiles
+from utils import Utils as utils
+
+# Formatos de transação reconhecidos, na ordem em que são tentados.
+# Compilados uma única vez no import do módulo.
+
+# Padrão 1: Descrição ANTES do valor (ex: "01/08 PG 'B4A GLAMBOX R$ 76,76 Parcela")
+PATTERN_NORMAL = re.compile(
+    r'(\d{2}/\d{2})\s+'          # Data (DD/MM)
+    r'(.*?)\s+'                   # Descrição (não guloso)
+    r'(R\$\s+[\d.,]+)\s*'        # Valor (R$ X,XX)
+    r'(.*)'                       # Parcelamento (opcional)
+)
+
+# Padrão 2: Valor ANTES da descrição (ex: "17/02 R$ 58,13 APP 'MONTISTUDIO")
+PATTERN_INVERTED = re.compile(
+    r'(\d{2}/\d{2})\s+'          # Data
+    r'(R\$\s+[\d.,]+)\s+'        # Valor
+    r'(.+?)\s+(?=(R\$|Parcela))'                   # Descrição + Parcelamento
+    r'(Parcela \d+ de \d+)?'      # Parcelamento (opcional)
+)
+
+# Padrão 3: Data completa, descrição antes do valor
+PATTERN_FULL_DATE = re.compile(
+    r'(\d{2}/\d{2}/\d{4})\s+'     # Data
+    r'(.*?)\s+'                   # Descrição (não guloso)
+    r'(R\$\s+[\d.,]+)\s+'         # Valor
+    r'(.*)'                       # Parcelamento (opcional)
+)
+
+# Padrão 4: Data completa com parcelamento antes do valor
+PATTERN_FULL_DATE_PARCELA = re.compile(
+    r'(\d{2}/\d{2}/(?:\d{2}|\d{4}))\s+'  # Data (dd/mm/aa OU dd/mm/aaaa)
+    r'(.+?)\s+'                          # Descrição (não gulosa, até o próximo padrão)
+    r'(?:Parcela\s+(\d+ de \d+)\s+)?'       # Parcelamento (opcional)
+    r'(R\$\s+[\d.,]+)'                   # Valor (R$24,15 ou R$ 24,15)
+)
+
+class TransactionParser:
+
+    compiled = {}
+
+    @classmethod
+    def get_compiled(self, bank_name):
+        # Converte o perfil declarativo do banco em padrões prontos para uso
+        compiled = self.compiled.get(bank_name)
+        if compiled is None:
+            profile = profiles.get(bank_name)
+            compiled = {
+                'date': re.compile(profile['date_format']).match,
+                'noise_prefixes': tuple(profile['noise_prefixes']),
+                'skip_prefixes': tuple(profile['skip_prefixes']),
+                'replacements': [tuple(pair) for pair in profile['replacements']]
+            }
+            self.compiled[bank_name] = compiled
+        return compiled
+
+    @classmethod
+    def iter_lines(self, text, bank_name):
+        # Aceita o texto inteiro ou um iterável de linhas; cada linha é tratada uma única vez
+        compiled = self.get_compiled(bank_name)
+        noise_prefixes = compiled['noise_prefixes']
+        replacements = compiled['replacements']
+
+        for raw_line in (text.split('\n') if isinstance(text, str) else text):
+            line = raw_line.strip()
+            if not line or raw_line.startswith(noise_prefixes):
+                continue
+            for old, new in replacements:
+                line = line.replace(old, new)
+            yield line
+
+    @classmethod
+    def iter_raw_transactions(self, lines, bank_name):
+        # Agrupa as linhas de cada transação: uma linha com data abre uma nova transação
+        compiled = self.get_compiled(bank_name)
+        is_date = compiled['date']
+        skip_prefixes = compiled['skip_prefixes']
+
+        transaction_parts = None
+        for line in lines:
+            if is_date(line):
+                if transaction_parts is not None:
+                    yield " ".join(transaction_parts)
+                transaction_parts = [line]
+            elif transaction_parts is not None and not line.startswith(skip_prefixes):
+                sucesso, valor = utils.tryparse_decimal(line)
+                if sucesso:
+                    line = f"***{'R$'}***{valor}***"
+                transaction_parts.append(line)
+
+        if transaction_parts is not None:
+            yield " ".join(transaction_parts)
+
+    def parse_transaction(raw_transaction):
+        # Padroniza "RS" para "R$" e remove espaços extras
+        raw_transaction = raw_transaction.replace("RS ", "R$ ").replace("Rs ", "R$ ").strip()
+
+        # Tenta o padrão normal (descrição antes do valor)
+        match = PATTERN_NORMAL.search(raw_transaction)
+        if match:
+            data, descricao, valor, parcelamento = match.groups()
+            descricao, parcelamento = descricao.strip(), parcelamento.strip()
+            text = f"{data} {descricao} {valor} {parcelamento}".strip()
+            return {'date': data, 'description': descricao, 'amount': valor, 'installment': parcelamento, 'text': text}
+
+        # Tenta o padrão invertido (valor antes da descrição)
+        match = PATTERN_INVERTED.search(raw_transaction)
+        if match:
+            data, valor, resto, _, parcelamento = match.groups()
+            if parcelamento and parcelamento in resto:
+                descricao = resto.replace(parcelamento, "").strip()
+            else:
+                descricao = resto.strip()
+            text = f"{data} {descricao} {valor} {parcelamento if parcelamento else ''}".strip()
+            return {'date': data, 'description': descricao, 'amount': valor, 'installment': parcelamento or '', 'text': text}
+
+        # Data completa, descrição antes do valor
+        match = PATTERN_FULL_DATE.search(raw_transaction)
+        if match:
+            data, descricao, valor, hora = match.groups()
+            descricao, hora = descricao.strip(), hora.strip()
+            text = f"{data} {descricao} {valor} {hora}".strip()
+            return {'date': data, 'description': descricao, 'amount': valor, 'installment': hora, 'text': text}
+
+        match = PATTERN_FULL_DATE_PARCELA.search(raw_transaction)
+        if match:
+            data, descricao, parcelamento, valor = match.groups()
+            descricao = descricao.strip()
+            text = f"{data} {descricao} {valor} {parcelamento if parcelamento else '-'}".strip()
+            return {'date': data, 'description': descricao, 'amount': valor, 'installment': parcelamento or '-', 'text': text}
+
+        # Se nenhum padrão for encontrado, mantém o original (para debug)
+        return {'date': None, 'description': raw_transaction, 'amount': None, 'installment': None, 'text': raw_transaction}
+
+    @classmethod
+    def iter_transactions(self, text, bank_name):
+        # Passo único: linhas -> transações brutas -> transações estruturadas
+        lines = self.iter_lines(text, bank_name)
+        for raw_transaction in self.iter_raw_transactions(lines, bank_name):
+            yield self.parse_transaction(raw_transaction)
+
+    @classmethod
+    def iter_tagged_transactions(self, tagged_lines, bank_name):
+        # Como iter_transactions, mas cada linha chega como (etiqueta, linha), por exemplo o
+        # índice do print de origem; a transação herda a etiqueta da linha de data que a abriu
+        is_date = self.get_compiled(bank_name)['date']
+        tags = deque()
+
+        def iter_lines():
+            for tag, raw_line in tagged_lines:
+                for line in self.iter_lines([raw_line], bank_name):
+                    if is_date(line):
+                        tags.append(tag)
+                    yield line
+
+        for raw_transaction in self.iter_raw_transactions(iter_lines(), bank_name):
+            yield tags.popleft(), self.parse_transaction(raw_transaction)
+
+    def get_line_overlap(previous_lines, lines, min_lines=2):
+        # Maior n em que as n primeiras linhas de um print repetem as n últimas do anterior
+        for size in range(min(len(previous_lines), len(lines)), min_lines - 1, -1):
+            if previous_lines[-size:] == lines[:size]:
+                return size
+        return 0
+
+class TransactionIndex:
+    # Rede de segurança contra prints sobrepostos: se as primeiras transações de um print repetem
+    # (mesma data, descrição, valor e parcela) as últimas do print anterior, a repetição é descartada.
+    # Transações iguais em outras posições (duas corridas iguais no mesmo dia) são mantidas.
+
+    def __init__(self):
+        self.tag = None
+        self.previous = []
+        self.current = []
+        # Transações do print atual retidas enquanto podem ser a continuação do anterior
+        self.pending = []
+        self.candidates = []
+        self.removed = 0
+
+    def get_key(transaction):
+        normalized = "|".join(
+            " ".join(str(transaction.get(field) or '').split()).upper()
+            for field in ('date', 'description', 'amount', 'installment')
+        )
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+    def add(self, tag, transaction):
+        # Retorna as transações liberadas (na ordem) depois de receber esta
+        released = []
+        if tag != self.tag:
+            released.extend(self.flush())
+            self.previous, self.current, self.tag = self.current, [], tag
+
+        key = TransactionIndex.get_key(transaction)
+        index = len(self.current)
+        self.current.append(key)
+        if index == 0:
+            self.candidates = [position for position, previous_key in enumerate(self.previous) if previous_key == key]
+        else:
+            self.candidates = [
+                position for position in self.candidates
+                if position + index < len(self.previous) and self.previous[position + index] == key
+            ]
+
+        if not self.candidates and not self.pending:
+            released.append(transaction)
+            return released
+
+        if self.candidates:
+            self.pending.append(transaction)
+            # Sobreposição confirmada quando o trecho repetido chega ao fim do print anterior
+            if any(position + index + 1 == len(self.previous) for position in self.candidates):
+                self.removed += len(self.pending)
+                self.pending, self.candidates = [], []
+                self.previous = []
+            return released
+
+        # Nenhum alinhamento sobreviveu: o que estava retido era legítimo
+        released.extend(self.pending)
+        released.append(transaction)
+        self.pending = []
+        return released
+
+    def flush(self):
+        # Fim do print (ou da fatura) com transações ainda retidas: eram só parte de uma
+        # sequência do anterior que não chegou ao fim dele, portanto legítimas
+        released, self.pending, self.candidates = self.pending, [], []
+        return released
@@ -1,9 +1,21 @@
 import locale
+import os
+import re
+from bank_profiles import BankProfiles as profiles
 
 pt_locale = 'en_US.UTF-8'  #Linux
 # pt_locale = 'pt_BR.ISO8859-1'  #Linux
 # pt_locale = 'Portuguese_Brazil.1252'  #windows
 
+# Diretório local para caches e arquivos de estado entre execuções
+state_dir = os.environ.get('FINANCETRACK_STATE_DIR', '.financetrack')
+
+# Nomes das abas da planilha (e das subpastas de mês no Drive)
+month_names = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+# Só textos com cara de número chegam ao float(); evita lançar exceção na maioria das linhas
+number_like = re.compile(r'\s*[+-]?(?:[\d_.]+(?:[eE][+-]?[\d_]+)?|inf|infinity|nan)\s*', re.IGNORECASE)
+
 class Utils:
 
     def get_current_month():
@@ -18,26 +30,52 @@ class Utils:
         year = datetime.now().strftime("%Y")
         return year
 
+    def get_current_sheet_month():
+        from datetime import datetime
+        return month_names[datetime.now().month - 1]
+
+    def parse_months(spec):
+        # Aceita "Fev", "Jan,Mar" ou intervalos como "Jan..Dez"
+        lookup = {name.lower(): index for index, name in enumerate(month_names)}
+        months = []
+        for part in spec.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '..' in part:
+                first, last = (lookup.get(name.strip().lower()) for name in part.split('..', 1))
+                if first is None or last is None or first > last:
+                    raise ValueError(f"Intervalo de meses inválido: {part}")
+                months.extend(month_names[first:last + 1])
+            elif part.lower() in lookup:
+                months.append(month_names[lookup[part.lower()]])
+            else:
+                raise ValueError(f"Mês inválido: {part}")
+        return list(dict.fromkeys(months))
+
+    def get_state_dir(name):
+        path = os.path.join(state_dir, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
     def get_first_line(bank):
-        if bank == "c6":
-            return 39, 3, 4
-        elif bank == "xp":
-            return 25, 7, 8
+        sheet = profiles.get(bank)['sheet']
+        return sheet['start_row'], sheet['col_descricao'], sheet['col_valor']
+
+    def get_sheet_name(bank):
+        return profiles.get(bank)['sheet']['name']
 
     def tryparse_decimal(texto):
         try:
             # Remove pontos de milhar (opcional) e substitui vírgula por ponto
             texto_limpo = texto.replace(".", "").replace(",", ".")
+            if not number_like.fullmatch(texto_limpo):
+                return (False, None)
             valor = float(texto_limpo)
             return (True, str(valor).replace('.', ','))
         except (ValueError, AttributeError):
             return (False, None)
         
     def get_regex_pattern(bank_name):
-        if bank_name == "c6":
-            return [r'\d{2}/\d{2}']
-        elif bank_name == "xp":
-            return [
-                r'\d{2}/\d{2}/\d{4}',
-                r'\d{2}\.\d{2}'
-            ]
\ No newline at end of file
+        profile = profiles.get(bank_name)
+        return [profile['date_format']] + profile['extra_formats']
@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sys
+import threading
+import time
+import traceback
+import main
+from google_manager import GoogleManager as gdrive
+from google_session import GoogleSession as session
+from ledger import Ledger as ledger
+from ocr_processor import OcrProcessor as ocr
+from sheets_writer import SheetsWriter as writer
+from sync_manifest import SyncManifest as manifests
+from utils import Utils as utils
+
+class Watcher:
+
+    # Intervalo entre consultas ao Drive (segundos), variação aleatória e teto da espera após falhas
+    interval = float(os.environ.get('FINANCETRACK_WATCH_INTERVAL', '30'))
+    jitter = 0.2
+    max_backoff = float(os.environ.get('FINANCETRACK_WATCH_MAX_BACKOFF', '900'))
+
+    def __init__(self, banks, months=None, year=None, args=None):
+        # months/year None: acompanha o mês/ano corrente (vira sozinho na troca de mês)
+        self.banks = banks
+        self.months = months
+        self.year = year
+        self.args = args
+        self.stop_event = threading.Event()
+        self.page_token = None
+        self.folders = {}
+        self.failures = 0
+        self.status_path = os.path.join(utils.get_state_dir('watch'), 'status.json')
+        self.status = {
+            'pid': os.getpid(),
+            'state': 'starting',
+            'started_at': time.time(),
+            'banks': banks,
+            'polls': 0,
+            'runs': 0,
+            'last_poll': None,
+            'last_run': None,
+            'last_error': None,
+            'failures': 0,
+            'next_poll': None,
+            'last_summaries': []
+        }
+
+    def write_status(self, **fields):
+        # Arquivo de saúde: lido por `python watcher.py --check` (ou por um healthcheck externo)
+        self.status.update(fields, updated_at=time.time())
+        tmp_path = f"{self.status_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(self.status, fh, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.status_path)
+
+    def stop(self, signum=None, frame=None):
+        # O job em andamento termina; a espera entre consultas é interrompida na hora
+        if signum is not None:
+            print(f"Sinal {signum} recebido: encerrando após o job atual")
+        self.stop_event.set()
+
+    def get_jobs(self):
+        year = self.year or utils.get_current_year()
+        months = self.months or [utils.get_current_sheet_month()]
+        return [(bank, month, year) for bank in self.banks for month in months]
+
+    def warm_up(self):
+        # Modelo do EasyOCR (ou pool), credencial e clientes do Drive/Sheets carregados uma vez
+        started = time.perf_counter()
+        ocr.warm_up()
+        gdrive.get_drive_service(gdrive.credentials_path)
+        session.get_sheets_client(gdrive.credentials_path)
+        print(f"Aquecimento concluído em {time.perf_counter() - started:.1f}s")
+
+    def get_folder(self, bank, month, year):
+        # Só a pasta do mês fica guardada: enquanto ela não existe, vale a do ano (se permitido)
+        # e a do mês é procurada de novo a cada consulta, como faria o run_expenses
+        key = (bank, month, str(year))
+        if key not in self.folders:
+            folder_id = gdrive.get_folder_id_from_bank_name(year, bank, month)
+            if folder_id is None:
+                return gdrive.get_folder_id_from_bank_name(year, bank) if self.args.allow_year_folder else None
+            self.folders[key] = folder_id
+        return self.folders[key]
+
+    def get_pending_jobs(self, changes):
+        # Jobs cujas pastas (ou manifestos, para arquivos apagados) foram tocados pelas alterações
+        pending = []
+        for bank, month, year in self.get_jobs():
+            folder_id = self.get_folder(bank, month, year)
+            if folder_id is None:
+                continue
+            known = manifests.load(bank, year, month)['files']
+            for change in changes:
+                item = change.get('file') or {}
+                if change['fileId'] in known or folder_id in item.get('parents', []):
+                    pending.append((bank, month, year))
+                    break
+        return pending
+
+    def run_jobs(self, jobs):
+        # Mesmo caminho do main.py: um trace por job e resumo no final
+        writer.reset_budget()
+        self.write_status(state='processing', jobs=[f"{bank}/{year}/{month}" for bank, month, year in jobs])
+        summaries = asyncio.run(main.run_jobs(jobs, self.args))
+        main.print_summary(summaries)
+        self.write_status(runs=self.status['runs'] + 1, last_run=time.time(), last_summaries=summaries, jobs=[])
+        return summaries
+
+    def poll(self):
+        # Uma chamada ao changes.list por consulta; os jobs só rodam quando algo mudou nas pastas.
+        # Na primeira consulta todos os jobs rodam para alcançar o que mudou com o daemon parado
+        if self.page_token is None:
+            page_token = gdrive.get_changes_start_token(gdrive.credentials_path)
+            jobs = self.get_jobs()
+        else:
+            changes, page_token = gdrive.list_changes_from_drive(self.page_token, gdrive.credentials_path)
+            jobs = self.get_pending_jobs(changes) if changes else []
+
+        summaries = self.run_jobs(jobs) if jobs else []
+        failed = [summary for summary in summaries if summary['status'] != 'ok']
+        if failed:
+            # O token não avança: os mesmos jobs são tentados de novo na próxima consulta
+            raise RuntimeError("; ".join(f"{summary['bank']} {summary['month']}: {summary['status']}" for summary in failed))
+        self.page_token = page_token
+
+    def get_delay(self):
+        # Intervalo com jitter; após falhas seguidas, espera exponencial até max_backoff
+        delay = self.interval * (2 ** self.failures) if self.failures else self.interval
+        delay = min(self.max_backoff, delay)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run(self):
+        self.write_status(state='starting')
+        self.warm_up()
+        while not self.stop_event.is_set():
+            try:
+                self.poll()
+                self.failures = 0
+                self.write_status(state='idle', last_poll=time.time(), polls=self.status['polls'] + 1, failures=0)
+            except Exception as error:
+                # Falha do Drive/Sheets (ou de um job): o estado fica no arquivo de saúde e a
+                # próxima tentativa espera mais
+                self.failures += 1
+                traceback.print_exc()
+                self.write_status(
+                    state='backoff', last_poll=time.time(), polls=self.status['polls'] + 1,
+                    failures=self.failures, last_error=str(error)
+                )
+
+            delay = self.get_delay()
+            self.write_status(next_poll=time.time() + delay)
+            self.stop_event.wait(delay)
+
+        ocr.shutdown_pool()
+        ledger.close()
+        self.write_status(state='stopped', next_poll=None)
+
+    def check(status_path, max_age):
+        # 0 se o daemon está vivo e consultou o Drive há menos de max_age segundos
+        try:
+            with open(status_path, 'r', encoding='utf-8') as fh:
+                status = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            print("Sem arquivo de status")
+            return 1
+        age = time.time() - status.get('updated_at', 0)
+        print(f"{status['state']}: atualizado há {age:.0f}s, {status['failures']} falhas seguidas, {status['runs']} execuções")
+        if status['state'] == 'stopped' or age > max_age:
+            return 1
+        return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Acompanha as pastas do Drive e importa prints novos assim que aparecem")
+    parser.add_argument('--banks', default="c6", help="Bancos separados por vírgula (ex: c6,xp)")
+    parser.add_argument('--months', default=None, help="Abas/meses acompanhados (padrão: mês atual, que muda sozinho)")
+    parser.add_argument('--year', default=None, help="Ano da pasta no Drive (padrão: ano atual)")
+    parser.add_argument('--interval', type=float, default=None, help="Segundos entre consultas ao Drive")
+    parser.add_argument('--max-backoff', type=float, default=None, help="Espera máxima entre tentativas após falhas")
+    parser.add_argument('--jobs', type=int, default=4, help="Quantidade de jobs banco/mês simultâneos")
+    parser.add_argument('--ocr-workers', type=int, default=None, help="Processos do pool de OCR compartilhado")
+    parser.add_argument('--ocr-mode', default=None, choices=['default', 'fast_cpu'], help="Modo de inferência do EasyOCR")
+    parser.add_argument('--on-disk', action='store_true', help="Baixa as imagens para disco em vez de mantê-las em memória")
+    parser.add_argument('--check', action='store_true', help="Só confere o arquivo de status (código de saída 1 se parado ou atrasado)")
+    parser.add_argument('--max-age', type=float, default=None, help="Com --check: idade máxima do status (padrão: 3x o teto de espera)")
+    args = parser.parse_args()
+
+    if args.interval is not None:
+        Watcher.interval = args.interval
+    if args.max_backoff is not None:
+        Watcher.max_backoff = args.max_backoff
+
+    if args.check:
+        status_path = os.path.join(utils.get_state_dir('watch'), 'status.json')
+        sys.exit(Watcher.check(status_path, args.max_age or 3 * Watcher.max_backoff))
+
+    if args.ocr_workers is not None:
+        ocr.workers = args.ocr_workers
+    if args.ocr_mode is not None:
+        ocr.configure(mode=args.ocr_mode)
+
+    banks = [bank.strip() for bank in args.banks.split(',') if bank.strip()]
+    months = utils.parse_months(args.months) if args.months else None
+    # Opções que o main.run_pipeline espera
+    args.full = False
+    args.allow_year_folder = months is None or len(months) == 1
+
+    watcher = Watcher(banks, months, args.year, args)
+    signal.signal(signal.SIGTERM, watcher.stop)
+    signal.signal(signal.SIGINT, watcher.stop)
+    watcher.run()